@@ -1 +1,2 @@
-from model_utils.data_processing import load_raw_data
\ No newline at end of file
+from model_utils.data_processing import load_raw_data, load_tokenized_data
+from model_utils.batching import TokenBudgetBatchSampler, TokenBudgetTrainer
\ No newline at end of file
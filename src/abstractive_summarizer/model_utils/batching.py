@@ -0,0 +1,168 @@
+import time
+import numpy as np
+import torch
+import pyarrow.compute as pc
+from transformers import Seq2SeqTrainer
+
+# 每筆資料之 (輸入長度, 摘要長度)
+def example_lengths(dataset):
+    table = dataset.select_columns(['input_ids', 'labels']).with_format('arrow')[:]
+    return np.stack([pc.list_value_length(table['input_ids']).to_numpy(zero_copy_only=False),
+                     pc.list_value_length(table['labels']).to_numpy(zero_copy_only=False)], axis=1)
+
+# 批次 padding 後之 token 數 (輸入 + 摘要)
+def padded_tokens(lengths):
+    return len(lengths) * int(lengths[:, 0].max() + lengths[:, 1].max())
+
+# 依序切分 (每段 token 數不超過 cap, 加入一筆不會使成本下降, 因此貪婪切分之段數最少)
+def greedy_chunks(lengths, cap):
+    chunks, start = [], 0
+    for end in range(1, len(lengths) + 1):
+        if end - start > 1 and padded_tokens(lengths[start:end]) > cap:
+            chunks.append((start, end - 1))
+            start = end - 1
+    chunks.append((start, len(lengths)))
+    return chunks
+
+# 切分為剛好 k 段: 預算內貪婪切分, 段數不足時對半切分最大段, 超過時放寬預算
+def split_step(lengths, k, max_tokens):
+    chunks = greedy_chunks(lengths, max_tokens)
+    if len(chunks) > k:
+        low, high = max_tokens, padded_tokens(lengths)
+        while low < high:
+            mid = (low + high) // 2
+            if len(greedy_chunks(lengths, mid)) <= k:
+                high = mid
+            else:
+                low = mid + 1
+        chunks = greedy_chunks(lengths, low)
+    while len(chunks) < min(k, len(lengths)):
+        start, end = max(chunks, key=lambda c: c[1] - c[0])
+        i = chunks.index((start, end))
+        chunks[i:i+1] = [(start, (start + end) // 2), ((start + end) // 2, end)]
+    return chunks
+
+
+class TokenBudgetBatchSampler(torch.utils.data.Sampler):
+    '''
+    Length-grouped batches under a token budget, with a fixed number of sequences per optimizer step:
+    every epoch the examples are shuffled into pools, sorted by length inside a pool,
+    cut into steps of effective_batch_size examples, and every step is split into
+    accumulation_steps micro-batches (gradient_accumulation_steps of the Trainer)
+
+    Args:
+        dataset: tokenized dataset (input_ids, labels)
+        max_tokens(int): padded input + label tokens of a micro-batch
+        effective_batch_size(int): examples per optimizer step (per_device_train_batch_size x gradient_accumulation_steps before)
+        accumulation_steps(int): micro-batches per step (default: the fewest keeping the first epoch within max_tokens)
+        pool_steps(int): steps per length-sorted pool
+    '''
+    def __init__(self, dataset, max_tokens=16384, effective_batch_size=32, accumulation_steps=None,
+                 pool_steps=50, shuffle=True, seed=42):
+        self.lengths = example_lengths(dataset)
+        self.max_tokens, self.effective_batch_size = max_tokens, effective_batch_size
+        self.pool_steps, self.shuffle, self.seed = pool_steps, shuffle, seed
+        self.epoch = 0
+        if accumulation_steps is None:
+            accumulation_steps = max([len(greedy_chunks(self.lengths[step], max_tokens)) for step in self.steps(0)] or [1])
+        self.accumulation_steps = accumulation_steps
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    # 各 step 之資料索引 (最後一個不足 effective_batch_size 之 step 固定在最後)
+    def steps(self, epoch):
+        rng = np.random.RandomState(self.seed + epoch)
+        order = rng.permutation(len(self.lengths)) if self.shuffle else np.arange(len(self.lengths))
+        pool_size = self.pool_steps * self.effective_batch_size
+        total = self.lengths.sum(axis=1)
+        for start in range(0, len(order), pool_size):
+            pool = order[start:start+pool_size]
+            order[start:start+pool_size] = pool[np.argsort(-total[pool], kind='stable')]
+        n_full = len(order) // self.effective_batch_size * self.effective_batch_size
+        steps = [order[i:i+self.effective_batch_size] for i in range(0, n_full, self.effective_batch_size)]
+        if self.shuffle:
+            steps = [steps[i] for i in rng.permutation(len(steps))]
+        if n_full < len(order):
+            steps.append(order[n_full:])
+        return steps
+
+    # 各 micro-batch 之資料索引
+    def batches(self, epoch):
+        for step in self.steps(epoch):
+            for start, end in split_step(self.lengths[step], self.accumulation_steps, self.max_tokens):
+                yield step[start:end].tolist()
+
+    def __iter__(self):
+        epoch = self.epoch
+        self.epoch += 1
+        return self.batches(epoch)
+
+    def __len__(self):
+        n_full, rest = divmod(len(self.lengths), self.effective_batch_size)
+        return n_full * self.accumulation_steps + min(self.accumulation_steps, rest)
+
+    # padding 效率 (實際 token / padding 後 token) 及超過預算之 micro-batch 數
+    def padding_stats(self, epoch=0):
+        real = padded = over = 0
+        for batch in self.batches(epoch):
+            lengths = self.lengths[batch]
+            real += int(lengths.sum())
+            padded += padded_tokens(lengths)
+            over += len(batch) > 1 and padded_tokens(lengths) > self.max_tokens
+        return {'padding_efficiency': real / max(padded, 1), 'micro_batches': len(self), 'over_budget': over}
+
+
+class TokenBudgetTrainer(Seq2SeqTrainer):
+    '''
+    Seq2SeqTrainer on TokenBudgetBatchSampler batches
+    The loss of every example is its token mean weighted by 1 / effective_batch_size (the mean over the examples of a step),
+    as training with per_device_train_batch_size=1 and gradient_accumulation_steps=effective_batch_size.
+    Logs padding efficiency and measured training samples/sec
+    '''
+    def __init__(self, *args, batch_sampler=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.args.gradient_accumulation_steps != batch_sampler.accumulation_steps:
+            raise ValueError('gradient_accumulation_steps (%d) != batch_sampler.accumulation_steps (%d)'
+                             % (self.args.gradient_accumulation_steps, batch_sampler.accumulation_steps))
+        self.batch_sampler = batch_sampler
+        # loss 已依 step 之資料數正規化, Trainer 只需除以 gradient_accumulation_steps
+        self.model_accepts_loss_kwargs = False
+        self.batch_stats = {'samples': 0, 'real': 0, 'padded': 0, 'start': None}
+
+    def get_train_dataloader(self):
+        dataloader = torch.utils.data.DataLoader(self.train_dataset, batch_sampler=self.batch_sampler,
+                                                 collate_fn=self.data_collator,
+                                                 num_workers=self.args.dataloader_num_workers,
+                                                 pin_memory=self.args.dataloader_pin_memory)
+        return self.accelerator.prepare(dataloader)
+
+    def compute_loss(self, model, inputs, return_outputs=False, num_items_in_batch=None):
+        if not model.training:
+            return super().compute_loss(model, inputs, return_outputs, num_items_in_batch)
+        labels = inputs['labels']
+        outputs = model(**inputs)
+        token_loss = torch.nn.functional.cross_entropy(outputs.logits.float().transpose(1, 2), labels,
+                                                       ignore_index=-100, reduction='none')
+        mask = labels.ne(-100)
+        example_loss = token_loss.sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        # Trainer 會再除以本 step 之 micro-batch 數
+        accumulation = getattr(self, 'current_gradient_accumulation_steps', self.args.gradient_accumulation_steps)
+        loss = example_loss.sum() * accumulation / self.batch_sampler.effective_batch_size
+        self._update_stats(inputs, mask)
+        return (loss, outputs) if return_outputs else loss
+
+    def _update_stats(self, inputs, mask):
+        stats = self.batch_stats
+        if stats['start'] is None:
+            stats['start'] = time.time()
+        stats['samples'] += len(mask)
+        stats['real'] += int(inputs['attention_mask'].sum()) + int(mask.sum())
+        stats['padded'] += inputs['attention_mask'].numel() + mask.numel()
+
+    def log(self, logs, *args, **kwargs):
+        stats = self.batch_stats
+        if stats['samples']:
+            logs['padding_efficiency'] = round(stats['real'] / stats['padded'], 4)
+            logs['measured_samples_per_second'] = round(stats['samples'] / max(time.time() - stats['start'], 1e-9), 3)
+        super().log(logs, *args, **kwargs)
@@ -1,5 +1,9 @@
+import os
+import json
+import glob
+import hashlib
 import pandas as pd
-from datasets import Dataset
+from datasets import Dataset, DatasetDict, load_from_disk
 
 # Dataframe 轉換 Dataset format
 def convert_to_Dataset(file):
@@ -7,11 +11,66 @@ def convert_to_Dataset(file):
     dataset = Dataset.from_pandas(df)
     return dataset
 
+# parquet 檔案或 shard 目錄
+def parquet_files(path):
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, 'part-*.parquet')) or glob.glob(os.path.join(path, '*.parquet')))
+    return [path]
+
+# parquet 直接轉為 Arrow Dataset (memory-mapped, 不經 pandas)
+def load_parquet_dataset(path, cache_dir=None):
+    return Dataset.from_parquet(parquet_files(path), cache_dir=cache_dir)
+
 # 匯入 train, test - Dataset format
-def load_raw_data(train_file, test_file, val_size=0.1):
-    train = convert_to_Dataset(train_file)
-    test = convert_to_Dataset(test_file)
-    raw_data = train.train_test_split(test_size=val_size, seed=42)
+def load_raw_data(train_file, test_file, val_size=0.1, seed=42, cache_dir=None):
+    train = load_parquet_dataset(train_file, cache_dir)
+    test = load_parquet_dataset(test_file, cache_dir)
+    raw_data = train.train_test_split(test_size=val_size, seed=seed)
     raw_data['validation'] = raw_data.pop('test')
     raw_data['test'] = test
-    return raw_data
\ No newline at end of file
+    return raw_data
+
+# tokenize 句子對 (extract -> input_ids, abstract -> labels)
+def tokenize_pairs(examples, tokenizer, max_input_length, max_target_length):
+    model_inputs = tokenizer(examples['extract'], max_length=max_input_length, truncation=True)
+    labels = tokenizer(text_target=examples['abstract'], max_length=max_target_length, truncation=True)
+    model_inputs['labels'] = labels['input_ids']
+    return model_inputs
+
+# 快取鍵: tokenizer、長度上限、切分參數、來源檔案 (路徑, 大小, 修改時間)
+def cache_key(train_file, test_file, tokenizer, max_input_length, max_target_length, val_size, seed):
+    files = [(os.path.abspath(file), os.path.getsize(file), os.path.getmtime(file))
+             for path in (train_file, test_file) for file in parquet_files(path)]
+    key = {'tokenizer': [type(tokenizer).__name__, tokenizer.name_or_path, len(tokenizer)],
+           'max_input_length': max_input_length, 'max_target_length': max_target_length,
+           'val_size': val_size, 'seed': seed, 'files': files}
+    return key, hashlib.sha1(json.dumps(key).encode()).hexdigest()[:16]
+
+# 匯入 tokenized train, validation, test (第一次 tokenize 後存於 cache_dir, 之後以 memory map 讀取)
+def load_tokenized_data(train_file, test_file, tokenizer, max_input_length=1024, max_target_length=512,
+                        val_size=0.1, seed=42, cache_dir=None, num_proc=None):
+    '''
+    Args:
+        train_file, test_file(str): sentence pair parquet (file or folder of shards)
+        tokenizer: tokenizer of the model checkpoint
+        cache_dir(str): tokenized datasets folder (default: tokenized/ next to train_file)
+    Returns:
+        tokenize_data(DatasetDict): train, validation, test with input_ids, attention_mask, labels
+    '''
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(train_file)), 'tokenized')
+    key, name = cache_key(train_file, test_file, tokenizer, max_input_length, max_target_length, val_size, seed)
+    path = os.path.join(cache_dir, name)
+    if os.path.exists(os.path.join(path, 'dataset_dict.json')):
+        return load_from_disk(path)
+
+    raw_data = load_raw_data(train_file, test_file, val_size, seed)
+    fn_kwargs = {'tokenizer': tokenizer, 'max_input_length': max_input_length, 'max_target_length': max_target_length}
+    tokenize_data = DatasetDict({split: dataset.map(tokenize_pairs, batched=True, num_proc=num_proc, fn_kwargs=fn_kwargs,
+                                                    remove_columns=dataset.column_names)
+                                 for split, dataset in raw_data.items()})
+    tmp = path + '.part'
+    tokenize_data.save_to_disk(tmp)
+    with open(os.path.join(tmp, 'cache_key.json'), 'w') as f:
+        json.dump(key, f, indent=2)
+    os.replace(tmp, path)
+    return load_from_disk(path)
@@ -1,22 +1,67 @@
+import os
+import json
 import time
+import hashlib
+import sqlite3
+import numpy as np
+import pandas as pd
 import sklearn.model_selection as sk
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+from joblib import Parallel, delayed
 # import dask_ml.model_selection as dcv
 from contextlib import contextmanager
 
 
 # 超參數優化
-def do_HPO(model, gridsearch_params, X, y, metric='f1', mode='gpu-Grid', n_folds=5, n_iter=10):
+def do_HPO(model, gridsearch_params, X, y, metric='f1', mode='gpu-grid', n_folds=5, n_iter=10, n_jobs=None,
+           resource='n_samples', factor=3, min_resources=None, store='hpo_trials', random_state=42):
+    '''
+    Args:
+        mode(str): gpu-grid, gpu-random (sklearn GridSearchCV / RandomizedSearchCV),
+                   halving-grid, halving-random (successive halving, resumable through the trial store)
+        n_jobs(int): parallel jobs (halving modes default: all cores, 1 for GPU models;
+                     the thread count of the model is set to 1 when the fits run in parallel)
+        resource(str): halving budget, 'n_samples' (training rows) or 'n_estimators' (boosting rounds)
+        factor(int): halving factor, 1/factor of the candidates continue with factor x budget
+        min_resources(int): budget of the first rung
+        store(str): trial store folder (halving modes)
+    '''
+    mode = mode.lower()
     if mode == 'gpu-grid':
-        clf = sk.GridSearchCV(model, gridsearch_params, cv=n_folds, scoring=metric)
+        clf = sk.GridSearchCV(model, gridsearch_params, cv=n_folds, scoring=metric, n_jobs=n_jobs)
     elif mode == 'gpu-random':
-        clf = sk.RandomizedSearchCV(model, gridsearch_params, cv=n_folds, scoring=metric, n_iter=n_iter)     
+        clf = sk.RandomizedSearchCV(model, gridsearch_params, cv=n_folds, scoring=metric, n_iter=n_iter, n_jobs=n_jobs)
+    elif mode in ('halving-grid', 'halving-random'):
+        # 預算參數 (n_estimators) 由 successive halving 決定, 不列入候選參數
+        params = {k: v for k, v in gridsearch_params.items() if k != resource}
+        candidates = list(sk.ParameterGrid(params)) if mode == 'halving-grid' else \
+            list(sk.ParameterSampler(params, n_iter, random_state=random_state))
+        max_resources = resource_limit(gridsearch_params[resource]) if resource in gridsearch_params else None
+        res = successive_halving(model, candidates, X, y, metric, n_folds, n_jobs, resource, factor,
+                                 min_resources, store, random_state, max_resources)
+        setattr(res, 'param_grid' if mode == 'halving-grid' else 'param_distributions', params)
+        print("Best params: {}\nBest score: {}".format(res.best_params_, res.best_score_))
+        return res.best_estimator_, res
     else:
-        print("please choose one of [gpu-grid, gpu-random] mode")
-        return None, None  
+        print("please choose one of [gpu-grid, gpu-random, halving-grid, halving-random] mode")
+        return None, None
     res = clf.fit(X, y)
     print("Best params: {}\nBest score: {}".format(res.best_params_, res.best_score_))
     return res.best_estimator_, res
 
+# 搜尋範圍之最大預算 (list 或 scipy.stats 離散分布)
+def resource_limit(values):
+    if hasattr(values, 'support'):
+        return int(values.support()[1])
+    return max(values)
+
+# GPU 模型 (XGBoost gpu_hist / cuda, cuML), 多個 fit 共用 GPU 時不平行
+def is_gpu_model(model):
+    params = model.get_params()
+    return type(model).__module__.startswith('cuml') or params.get('tree_method') == 'gpu_hist' \
+        or str(params.get('device') or '').startswith(('cuda', 'gpu'))
+
 # 代碼塊 - 執行時間
 @contextmanager
 def timed():
@@ -24,4 +69,169 @@ def timed():
     yield
     t1 = time.time()
     print("Run time: %8.5f" % (t1 - t0))
-    
\ No newline at end of file
+
+
+class TrialStore:
+    '''
+    Persistent CV scores (SQLite): one row per (model, data, params, budget, fold)
+    '''
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS trials (key TEXT PRIMARY KEY, params TEXT, resource TEXT, '
+                          'budget INTEGER, fold INTEGER, score REAL, fit_time REAL)')
+        self.conn.commit()
+
+    # key -> (score, fit_time)
+    def get(self, keys):
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start+500]
+            rows = self.conn.execute('SELECT key, score, fit_time FROM trials WHERE key IN (%s)'
+                                     % ','.join('?' * len(chunk)), chunk)
+            found.update((k, (score, fit_time)) for k, score, fit_time in rows)
+        return found
+
+    def put(self, key, params, resource, budget, fold, score, fit_time):
+        self.conn.execute('INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?)',
+                          (key, json.dumps(params, sort_keys=True, default=str), resource, budget, fold, score, fit_time))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+# 資料指紋 (內容雜湊)
+def data_fingerprint(X, y):
+    h = hashlib.sha1()
+    h.update(json.dumps([list(map(str, X.columns)), list(X.shape)]).encode())
+    h.update(pd.util.hash_pandas_object(X, index=False).values.tobytes())
+    h.update(pd.util.hash_pandas_object(pd.Series(np.asarray(y)), index=False).values.tobytes())
+    return h.hexdigest()[:16]
+
+# fold 資料快取: X, y 存為 .npy (worker 以 memory map 讀取) 及各 fold 之索引
+def cache_folds(X, y, n_folds, cache_dir, random_state=42):
+    if not os.path.exists(os.path.join(cache_dir, 'folds.npz')):
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(os.path.join(cache_dir, 'X.npy'), np.asarray(X, dtype=np.float32))
+        np.save(os.path.join(cache_dir, 'y.npy'), np.asarray(y))
+        folds = {}
+        cv = sk.StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+        rng = np.random.RandomState(random_state)
+        for i, (train, val) in enumerate(cv.split(np.zeros(len(y)), np.asarray(y))):
+            # 訓練索引隨機排列, 樣本預算取前 n 筆
+            folds['train%d' % i], folds['val%d' % i] = rng.permutation(train), val
+        tmp = os.path.join(cache_dir, 'folds.part.npz')
+        np.savez(tmp, **folds)
+        os.replace(tmp, os.path.join(cache_dir, 'folds.npz'))
+    return cache_dir
+
+# worker - 一個 fold 之訓練及評分
+def fit_fold(model, params, cache_dir, fold, resource, budget, metric, threads=None):
+    X, y = np.load(os.path.join(cache_dir, 'X.npy'), mmap_mode='r'), np.load(os.path.join(cache_dir, 'y.npy'))
+    with np.load(os.path.join(cache_dir, 'folds.npz')) as folds:
+        train, val = folds['train%d' % fold], folds['val%d' % fold]
+    est = clone(model).set_params(**{**params, **(threads or {})})
+    if resource == 'n_samples':
+        train = train[:budget]
+    else:
+        est.set_params(**{resource: budget})
+    train = np.sort(train)
+    t0 = time.time()
+    est.fit(X[train], y[train])
+    fit_time = time.time() - t0
+    return get_scorer(metric)(est, X[val], y[val]), fit_time
+
+# 各輪之預算 (min_resources x factor^i, 最後一輪為 max_resources)
+def rung_budgets(n_candidates, factor, min_resources, max_resources):
+    budgets, budget, n = [], min_resources, n_candidates
+    while budget < max_resources and n > 1:
+        budgets.append(int(budget))
+        budget, n = budget * factor, int(np.ceil(n / factor))
+    budgets.append(int(max_resources))
+    return budgets
+
+
+class SearchResult:
+    '''
+    Attributes as GridSearchCV / RandomizedSearchCV (plot_search_results, plot_heatmap)
+    cv_results_: every candidate scored at the largest budget it reached; history: every rung
+    '''
+    def __init__(self, candidates, history, best_estimator):
+        last = history.sort_values('iter').groupby('candidate').tail(1).sort_values('candidate')
+        self.cv_results_ = {'params': [candidates[i] for i in last['candidate']]}
+        for name in sorted({k for c in candidates for k in c}):
+            values = [candidates[i].get(name) for i in last['candidate']]
+            self.cv_results_['param_' + name] = np.ma.MaskedArray(values, mask=[False] * len(values), dtype=object)
+        for col in ['mean_test_score', 'std_test_score', 'mean_fit_time', 'iter', 'n_resources']:
+            self.cv_results_[col] = last[col].to_numpy()
+        # 排名: 先依到達之輪次, 再依分數
+        order = np.lexsort((-last['mean_test_score'].to_numpy(), -last['iter'].to_numpy()))
+        self.cv_results_['rank_test_score'] = np.empty(len(order), dtype=int)
+        self.cv_results_['rank_test_score'][order] = np.arange(1, len(order) + 1)
+        best = history.sort_values(['iter', 'mean_test_score'], ascending=False).iloc[0]
+        self.best_index_ = int(np.flatnonzero(last['candidate'].to_numpy() == best['candidate'])[0])
+        self.best_params_ = candidates[int(best['candidate'])]
+        self.best_score_ = float(best['mean_test_score'])
+        self.best_estimator_ = best_estimator
+        self.history = history
+
+
+# successive halving: 每輪評估候選參數 (未存於 trial store 者平行計算), 保留前 1/factor 進入下一輪
+def successive_halving(model, candidates, X, y, metric='f1', n_folds=5, n_jobs=None, resource='n_samples',
+                       factor=3, min_resources=None, store='hpo_trials', random_state=42, max_resources=None):
+    fingerprint = data_fingerprint(X, y)
+    os.makedirs(store, exist_ok=True)
+    cache_dir = cache_folds(X, y, n_folds, os.path.join(store, 'folds', '%s_%d_%d' % (fingerprint, n_folds, random_state)))
+    trials = TrialStore(os.path.join(store, 'trials.sqlite'))
+    if resource == 'n_samples':
+        max_resources = len(X) - int(np.ceil(len(X) / n_folds))
+        min_resources = min_resources or max(max_resources // factor ** 3, 1000)
+    else:
+        # XGBoost 之 n_estimators 預設為 None (即 100)
+        max_resources = max_resources or max([c[resource] for c in candidates if resource in c]
+                                             or [model.get_params().get(resource) or 100])
+        min_resources = min_resources or max(max_resources // factor ** 3, 10)
+        candidates = [{k: v for k, v in c.items() if k != resource} for c in candidates]
+        candidates = [dict(c) for c in {json.dumps(c, sort_keys=True, default=str): c for c in candidates}.values()]
+    # 平行 fit 時模型本身只用一個執行緒, 避免 n_jobs x 模型執行緒數 超過核心數
+    n_jobs = n_jobs or (1 if is_gpu_model(model) else -1)
+    threads = {k: 1 for k in ('n_jobs', 'nthread') if k in model.get_params()} if n_jobs != 1 else {}
+    # 不影響分數之參數 (執行緒數, 輸出) 不列入 trial key
+    fixed = {k: v for k, v in model.get_params().items() if k not in (resource, 'n_jobs', 'nthread', 'verbose', 'verbosity')}
+    base = json.dumps([type(model).__name__, fixed,
+                       metric, n_folds, random_state, fingerprint], sort_keys=True, default=str)
+
+    def key(params, budget, fold):
+        text = json.dumps([base, params, resource, budget, fold], sort_keys=True, default=str)
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    rows, alive = [], list(range(len(candidates)))
+    try:
+        for it, budget in enumerate(rung_budgets(len(candidates), factor, min_resources, max_resources)):
+            tasks = [(i, fold, key(candidates[i], budget, fold)) for i in alive for fold in range(n_folds)]
+            found = trials.get([k for _, _, k in tasks])
+            missing = [t for t in tasks if t[2] not in found]
+            print("iter %d: %d candidates, %s=%d, %d/%d fits cached"
+                  % (it, len(alive), resource, budget, len(tasks) - len(missing), len(tasks)))
+            jobs = (delayed(fit_fold)(model, candidates[i], cache_dir, fold, resource, budget, metric, threads)
+                    for i, fold, _ in missing)
+            # 每個 fit 完成即寫入 trial store, 中斷後可續跑
+            for (i, fold, k), (score, fit_time) in zip(missing, Parallel(n_jobs=n_jobs, return_as='generator')(jobs)):
+                trials.put(k, candidates[i], resource, budget, fold, score, fit_time)
+                found[k] = (score, fit_time)
+            means = {}
+            for i in alive:
+                scores, fit_times = zip(*[found[key(candidates[i], budget, fold)] for fold in range(n_folds)])
+                means[i] = np.mean(scores)
+                rows.append({'candidate': i, 'iter': it, 'n_resources': budget, 'mean_test_score': means[i],
+                             'std_test_score': np.std(scores), 'mean_fit_time': np.mean(fit_times)})
+            alive = sorted(alive, key=lambda i: -means[i])[:max(int(np.ceil(len(alive) / factor)), 1)]
+    finally:
+        trials.close()
+
+    # 最佳參數以全部資料 (及最大 boosting rounds) 重新訓練
+    history = pd.DataFrame(rows)
+    best = history.sort_values(['iter', 'mean_test_score'], ascending=False).iloc[0]
+    params = dict(candidates[int(best['candidate'])])
+    if resource != 'n_samples':
+        params[resource] = max_resources
+    return SearchResult(candidates, history, clone(model).set_params(**params).fit(X, y))
@@ -1,3 +1,5 @@
+from collections import namedtuple
+
 # 摘要結構表
 abstr_structure = {'I':['introduction','background','backgrounds','objective','objectives','purpose','purposes'],
                    'M':['method','methods'],
@@ -11,13 +13,58 @@ body_structure = {'I':['intro'],
                   'R':['results'],
                   'D':['discuss','concl']
                   }
+body_section_types = {'INTRO', 'METHODS', 'RESULTS', 'DISCUSS', 'CONCL'}
+
+# 查找表 (標題字串 -> IMRD)
+def build_lookup(structure):
+    lookup = {}
+    for key, val in structure.items():
+        for v in val:
+            lookup.setdefault(v, key)
+    return lookup
+
+# 結構轉換 (記憶已出現之原始字串, 每個字串只正規化一次)
+class StructureMapper(dict):
+    def __init__(self, structure):
+        super().__init__()
+        self.lookup = build_lookup(structure)
+
+    def __missing__(self, text):
+        key = 'None' if text is None else self.lookup.get(text.strip().replace(':','').lower(), 'None')
+        self[text] = key
+        return key
+
+abstr_mapper = StructureMapper(abstr_structure)
+body_mapper = StructureMapper(body_structure)
 
 # 結構轉換
 def structure_mapping(text, structure):
-    for key, val in structure.items():      
-        if text.strip().replace(':','').lower() in val:
-            return key
-    return 'None'
+    if structure is abstr_structure:
+        return abstr_mapper[text]
+    if structure is body_structure:
+        return body_mapper[text]
+    return StructureMapper(structure)[text]
+
+# 段落索引 - 單次走訪每個 passage
+# section: 正文 IMRD (依 section_type), heading: 摘要標題 IMRD (僅 abstract_title_1)
+Passage = namedtuple('Passage', ['section_type', 'type', 'text', 'section', 'heading'])
+
+def index_passages(p):
+    idx = []
+    for passage in p:
+        section_type = type = text = None
+        for child in passage:
+            if child.tag == 'infon':
+                key = child.get('key')
+                if key == 'section_type' and section_type is None:
+                    section_type = child.text
+                elif key == 'type' and type is None:
+                    type = child.text
+            elif child.tag == 'text' and text is None:
+                text = child.text
+        heading = abstr_mapper[text] if (section_type == 'ABSTRACT') and (type == 'abstract_title_1') else None
+        idx.append(Passage(section_type, type, text, body_mapper[section_type], heading))
+    return idx
 
 # 條件 - 非重複有序項目 -> IMRD
 def cond(s):
@@ -27,14 +74,16 @@ def cond(s):
     else:
         return False
 
+# 檢查是否_結構化寫作 (段落索引)
+def check_index(idx):
+    s1, s2 = [], []
+    for i in idx:
+        if i.heading is not None:
+            s1.append(i.heading)
+        elif i.section_type in body_section_types:
+            s2.append(i.section)
+    return cond(s1) and cond(s2)
+
 # 檢查是否_結構化寫作
 def check_structure(p):
-    s1 = [i.find('text').text for i in p if (i.find('infon[@key="section_type"]').text=='ABSTRACT') and (i.find('infon[@key="type"]').text=='abstract_title_1')]
-    s1 = [structure_mapping(i, abstr_structure) for i in s1 ]
-    if not cond(s1):
-        return False
-    s2 = [i.find('infon[@key="section_type"]').text for i in p if (i.find('infon[@key="section_type"]').text in ['INTRO', 'METHODS', 'RESULTS', 'DISCUSS', 'CONCL'])]
-    s2 = [structure_mapping(i, body_structure) for i in s2]
-    if not cond(s2):
-        return False
-    return True
+    return check_index(index_passages(p))
@@ -1,10 +1,20 @@
 from urllib.request import urlopen
 from urllib.error import HTTPError
-from xml.etree.ElementTree import fromstring
-from check_cond import check_structure, structure_mapping, body_structure
+from urllib.parse import urlsplit
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree.ElementTree import fromstring, ParseError
+from check_cond import check_structure, check_index, index_passages, structure_mapping, body_structure
+from xml2json import Xml2Json
+from json_store import ShardWriter
+import threading
+import time
 import os
 
 
+API_URL = 'https://www.ncbi.nlm.nih.gov/research/bionlp/RESTful/pmcoa.cgi/BioC_xml/%s/ascii'
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
 # PMCID list
 def read_pmcids(path):
     file = open(path)
@@ -15,13 +25,180 @@ def read_pmcids(path):
 # API(PMCID)
 def Bioc_API(Id):
     try:
-        data = urlopen('https://www.ncbi.nlm.nih.gov/research/bionlp/RESTful/pmcoa.cgi/BioC_xml/%s/ascii'%(Id))
+        data = urlopen(API_URL%(Id))
     except HTTPError as e:
         print(Id, 'HTTPError: {}'.format(e.code))
         return False
     else:
         return data.read()
 
+# 請求速率限制 (requests per second, 跨執行緒共用)
+class RateLimiter:
+    def __init__(self, rps):
+        self.interval = 1.0 / rps if rps else 0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+# 連線池 - 每個執行緒保留一條 keep-alive 連線
+class BiocClient:
+    def __init__(self, url=API_URL, rps=3, retries=5, backoff=1.0, timeout=60):
+        self.url = url
+        self.limiter = RateLimiter(rps)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self, parts):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            cls = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+            conn = cls(parts.netloc, timeout=self.timeout)
+            self.local.conn = conn
+        return conn
+
+    def _reset(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+        self.local.conn = None
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2 ** attempt
+
+    def fetch(self, Id):
+        '''
+        Returns:
+            data(bytes): response body, or
+            code(int): HTTP status code of a failed request (None if connection failed)
+        '''
+        parts = urlsplit(self.url % (Id))
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        code = None
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            retry_after = None
+            try:
+                conn = self._connection(parts)
+                conn.request('GET', path)
+                res = conn.getresponse()
+                data = res.read()
+                code = res.status
+                retry_after = res.getheader('Retry-After')
+                if res.getheader('Connection', '').lower() == 'close':
+                    self._reset()
+            except (HTTPException, OSError):
+                self._reset()
+                code = None
+            else:
+                if code == 200:
+                    return data
+                if code not in RETRY_STATUS:
+                    return code
+            if attempt < self.retries:
+                time.sleep(self._delay(attempt, retry_after))
+        return code
+
+# 進度紀錄 - 已下載(saved) / 不符合結構(rejected) / 失敗(error)
+class Manifest:
+    DONE = ('saved', 'rejected')
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.status = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    Id, _, status = line.rstrip('\n').partition('\t')
+                    self.status[Id] = status
+        self.file = open(path, 'a')
+
+    def done(self, Id):
+        return self.status.get(Id) in self.DONE
+
+    def record(self, Id, status):
+        with self.lock:
+            self.status[Id] = status
+            self.file.write('%s\t%s\n' % (Id, status))
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+# 儲存 XML 檔案
+def save_xml(od):
+    def save(Id, data, idx):
+        tmp = od + Id + '.xml.part'
+        with open(tmp, 'wb') as f:                  # 儲存符合條件_XML
+            f.write(data)
+        os.replace(tmp, od + Id + '.xml')
+    return save
+
+# 直接轉換 JSON 並寫入分片 (不另存 XML)
+def save_json(writer):
+    def save(Id, data, idx):
+        writer.write(Xml2Json(Id, idx))
+    return save
+
+# 下載單篇 -> 檢查結構 -> 儲存
+def crawl_one(Id, client, manifest, save):
+    data = client.fetch(Id)
+    if not isinstance(data, bytes):
+        print(Id, 'HTTPError: {}'.format(data))
+        manifest.record(Id, 'error')
+        return
+    try:
+        root = fromstring(data)
+        idx = index_passages(root.iter('passage'))
+        valid = check_index(idx)                    # 檢查是否_結構化寫作
+    except (ParseError, AttributeError):
+        manifest.record(Id, 'error')
+        return
+    if not valid:
+        manifest.record(Id, 'rejected')
+        return
+    save(Id, data, idx)
+    manifest.record(Id, 'saved')
+
+# 並行下載 (可中斷後續傳)
+# to_json: 跳過 XML, 將符合條件之文章直接轉為 JSON 寫入 od 之 JSONL.gz 分片
+def crawl(rf, od, n_workers=8, rps=3, retries=5, backoff=1.0, manifest=None, url=API_URL,
+          to_json=False, shard_size=1000):
+
+    if not os.path.exists(od):
+        os.makedirs(od)
+
+    manifest = Manifest(manifest or od.rstrip('/') + '.manifest.tsv')
+    client = BiocClient(url, rps=rps, retries=retries, backoff=backoff)
+    if to_json:
+        writer = ShardWriter(od, shard_size=shard_size)
+        save, exists = save_json(writer), writer.__contains__
+    else:
+        writer = None
+        save, exists = save_xml(od), lambda i: os.path.exists(od + i + '.xml')
+    pmcids = [i for i in read_pmcids(rf) if i and not manifest.done(i) and not exists(i)]
+    try:
+        with ThreadPoolExecutor(n_workers) as pool:
+            for _ in pool.map(lambda i: crawl_one(i, client, manifest, save), pmcids):
+                pass
+    finally:
+        manifest.close()
+        if writer is not None:
+            writer.close()
+
 #
 def main(rf, od):    
     
@@ -47,3 +224,5 @@ if __name__ == '__main__':
     output_dir = 'dataset/raw_data/xml/'
 
     # main(pmcids_list, output_dir)
+    # crawl(pmcids_list, output_dir, n_workers=8, rps=3)
+    # crawl(pmcids_list, 'dataset/raw_data/json_shards/', n_workers=8, rps=3, to_json=True)
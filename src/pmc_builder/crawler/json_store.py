@@ -0,0 +1,158 @@
+'''
+Sharded, append-only article storage (JSONL.gz)
+Each article is one json line compressed as its own gzip member,
+so a shard can be read sequentially with gzip.open
+or a single article can be read through the pmcid -> (shard, offset, length) index
+'''
+
+import threading
+import gzip
+import json
+import os
+
+
+INDEX_FILE = 'index.tsv'
+
+def shard_name(n):
+    return 'shard-%05d.jsonl.gz' % n
+
+# pmcid -> (shard, offset, length) 及最後一行完整索引之結尾位置
+# 中斷時寫入一半之行 (無換行或欄位數不符) 略過
+def _read_index(path):
+    index, end = {}, 0
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                end += len(line)
+                fields = line.decode('utf-8', 'replace').rstrip('\n').split('\t')
+                if len(fields) != 4 or not (fields[2].isdigit() and fields[3].isdigit()):
+                    continue
+                pmcid, shard, offset, length = fields
+                index[pmcid] = (shard, int(offset), int(length))
+    return index, end
+
+# pmcid -> (shard, offset, length)
+def load_index(rd):
+    return _read_index(os.path.join(rd, INDEX_FILE))[0]
+
+# 是否為分片格式目錄
+def is_sharded(rd):
+    return os.path.exists(os.path.join(rd, INDEX_FILE))
+
+
+class ShardWriter:
+    def __init__(self, od, shard_size=1000, compresslevel=6):
+        if not os.path.exists(od):
+            os.makedirs(od)
+        self.od = od
+        self.shard_size = shard_size
+        self.compresslevel = compresslevel
+        self.lock = threading.Lock()
+        self.index, end = _read_index(os.path.join(od, INDEX_FILE))
+        self.shard = self.file = None
+        self.count = 0
+        self._resume(end)
+        self.index_file = open(os.path.join(od, INDEX_FILE), 'a')
+
+    # 續寫最後一個分片, 並截斷未寫入索引之尾端資料 (索引檔截斷至最後一行完整索引)
+    def _resume(self, index_end=0):
+        path = os.path.join(self.od, INDEX_FILE)
+        if os.path.exists(path) and os.path.getsize(path) > index_end:
+            with open(path, 'r+b') as f:
+                f.truncate(index_end)
+        shards = {}
+        for shard, offset, length in self.index.values():
+            end, count = shards.get(shard, (0, 0))
+            shards[shard] = (max(end, offset + length), count + 1)
+        n = len([f for f in os.listdir(self.od) if f.startswith('shard-')])
+        if not shards:
+            return self._open(shard_name(n))
+        shard = max(shards)
+        end, count = shards[shard]
+        for f in os.listdir(self.od):
+            if f.startswith('shard-') and f > shard:
+                os.remove(os.path.join(self.od, f))
+        self._open(shard)
+        self.file.truncate(end)
+        self.file.seek(end)
+        self.count = count
+
+    def _open(self, shard):
+        if self.file is not None:
+            self.file.close()
+        path = os.path.join(self.od, shard)
+        self.file = open(path, 'r+b' if os.path.exists(path) else 'wb')
+        self.file.seek(0, os.SEEK_END)
+        self.shard = shard
+        self.count = 0
+
+    def __contains__(self, pmcid):
+        return pmcid in self.index
+
+    def write(self, paper):
+        data = gzip.compress((json.dumps(paper) + '\n').encode('utf-8'), self.compresslevel)
+        with self.lock:
+            if self.count >= self.shard_size:
+                self._open(shard_name(int(self.shard[6:11]) + 1))
+            offset = self.file.tell()
+            self.file.write(data)
+            self.file.flush()
+            self.count += 1
+            self.index[paper['id']] = (self.shard, offset, len(data))
+            self.index_file.write('%s\t%s\t%d\t%d\n' % (paper['id'], self.shard, offset, len(data)))
+            self.index_file.flush()
+
+    def close(self):
+        self.file.close()
+        self.index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# 讀取單篇 (分片或單檔 json 目錄)
+def read_paper(rd, pmcid, index=None):
+    if index is None and is_sharded(rd):
+        index = load_index(rd)
+    if index is None:
+        with open(os.path.join(rd, pmcid + '.json')) as f:
+            return json.load(f)
+    shard, offset, length = index[pmcid]
+    with open(os.path.join(rd, shard), 'rb') as f:
+        f.seek(offset)
+        return json.loads(gzip.decompress(f.read(length)))
+
+# 依序讀取所有文章 (分片或單檔 json 目錄)
+def iter_papers(rd):
+    if not is_sharded(rd):
+        for file in os.listdir(rd):
+            if file.endswith('.json') and os.path.isfile(os.path.join(rd, file)):
+                with open(os.path.join(rd, file)) as f:
+                    yield json.load(f)
+        return
+    index = load_index(rd)
+    ends = {}
+    for shard, offset, length in index.values():
+        ends[shard] = max(ends.get(shard, 0), offset + length)
+    for shard in sorted(ends):
+        with open(os.path.join(rd, shard), 'rb') as raw:
+            with gzip.open(_Limited(raw, ends[shard]), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
+
+# 只讀取至最後一筆索引位置 (忽略未完成之尾端寫入)
+class _Limited:
+    def __init__(self, f, end):
+        self.f = f
+        self.end = end
+
+    def read(self, size=-1):
+        left = self.end - self.f.tell()
+        if size < 0 or size > left:
+            size = left
+        return self.f.read(max(size, 0))
@@ -1,4 +1,5 @@
-from check_cond import abstr_structure, body_structure, structure_mapping
+from check_cond import abstr_structure, body_structure, structure_mapping, index_passages, Passage
+from json_store import ShardWriter
 import xml.etree.ElementTree as ET
 import json
 import os
@@ -15,33 +16,31 @@ def get_root(xml):
     return ET.parse(xml).getroot()
 
 # 標題
-def get_title(p):
+def get_title(idx):
     title = ''
-    for i in p:
-        if (i.find("infon[@key='section_type']").text == 'TITLE'):
-            title = i.find('text').text
+    for i in idx:
+        if i.section_type == 'TITLE':
+            title = i.text
             break
     return title
 
 # 摘要
-def get_abstract(p):
+def get_abstract(idx):
     abstract = {'I':[],'M':[],'R':[],'D':[]}
-    for i in p:
-        if (i.find("infon[@key='section_type']").text == 'ABSTRACT'):
-            type = i.find("infon[@key='type']").text
-            text = i.find('text').text
-            if type == 'abstract_title_1':
-                s = structure_mapping(text, abstr_structure)
-            elif type == 'abstract':
-                abstract[s].append(text)
+    for i in idx:
+        if i.section_type == 'ABSTRACT':
+            if i.type == 'abstract_title_1':
+                s = i.heading
+            elif i.type == 'abstract':
+                abstract[s].append(i.text)
     return abstract
 
 # 正文
-def get_body(p):
+def get_body(idx):
     body = {'I':[],'M':[],'R':[],'D':[]}
     start = end = False
-    for i in p:
-        s = structure_mapping(i.find("infon[@key='section_type']").text, body_structure)
+    for i in idx:
+        s = i.section
 
         if (s == 'I') and (not start):               # first "I" part and not start -> set start True
             start = True
@@ -50,33 +49,42 @@ def get_body(p):
         elif (s not in ['D','None']) and (end):      # after end = True, break if not "D" part or "None" part (e.g. figure)
             break
         
-        if (s in ['I','M','R','D']) and (i.find("infon[@key='type']").text == 'paragraph') and start:
-            text = i.find('text').text
-            body[s].append(text)
+        if (s in ['I','M','R','D']) and (i.type == 'paragraph') and start:
+            body[s].append(i.text)
     return body
 
-# 轉換_JSON
+# 轉換_JSON (p: passage 列表或 index_passages 之段落索引)
 def Xml2Json(pmcid, p):
+    idx = p if p and isinstance(p[0], Passage) else index_passages(p)
     paper = {}
     paper['id'] = pmcid
-    paper['title'] = get_title(p)
-    paper['abstract'] = get_abstract(p)
-    paper['body'] = get_body(p)
+    paper['title'] = get_title(idx)
+    paper['abstract'] = get_abstract(idx)
+    paper['body'] = get_body(idx)
     return paper
 
 #
-def main(rd, od):
+def main(rd, od, sharded=False, shard_size=1000):
     
     if not os.path.exists(od):      
         os.makedirs(od)
 
+    writer = ShardWriter(od, shard_size=shard_size) if sharded else None
     for file in get_file(rd):
+        if not file.endswith('.xml'):
+            continue
         r = get_root(rd + file)
         p = r.findall('.//passage')
         pmcid = file.split('.')[0]
         paper = Xml2Json(pmcid, p)
+        if writer is not None:
+            if pmcid not in writer:
+                writer.write(paper)
+            continue
         with open(od + pmcid + '.json', 'w') as f:
             f.write(json.dumps(paper))
+    if writer is not None:
+        writer.close()
 
 
 if __name__ == '__main__':
@@ -85,3 +93,4 @@ if __name__ == '__main__':
     output_dir = 'dataset/raw_data/json/'
     
     # main('xml/','json/')
+    # main(input_dir, 'dataset/raw_data/json_shards/', sharded=True)
@@ -2,5 +2,5 @@ import extoracle  # noqa
 import extoracle.utils  # noqa
 #import extoracle.bin  # noqa
 
-from extoracle.extoracle import METHODS, from_imrd  # noqa
+from extoracle.extoracle import METHODS, from_imrd, from_corpus  # noqa
 #from extoracle.extoracle import *
@@ -0,0 +1,86 @@
+"""
+Benchmarks of the oracle methods against their reference implementation
+on synthetic sections (up to Methods/Results sized)
+"""
+import time
+import random
+import extoracle.utils
+
+
+def synthetic_section(n_sents, n_abstract, vocab_size=2000, seed=0):
+    """Random section with a zipf-like vocabulary
+
+    Returns:
+        src(list): list of doc sentences (itself a list of words)
+        tgt(list): list of abstract sentences (itself a list of words)
+    """
+    rng = random.Random(seed)
+    vocab = ['w%d' % i for i in range(vocab_size)]
+    weights = [1.0 / (i + 1) for i in range(vocab_size)]
+
+    def sentence():
+        return rng.choices(vocab, weights, k=rng.randint(5, 40))
+    return ([sentence() for _ in range(n_sents)],
+            [sentence() for _ in range(n_abstract)])
+
+
+def _timed(method, src, tgt, summary_size, repeat):
+    t0 = time.time()
+    for _ in range(repeat):
+        ids, _ = method(src, tgt, summary_size)
+    return ids, (time.time() - t0) / repeat
+
+
+def benchmark_greedy(sizes=(50, 200, 500), n_abstract=8, repeat=3, seed=0):
+    """Compare `greedy_selection` and `incremental_greedy_selection`
+
+    Prints the time per section and checks that selections are identical.
+    """
+    same = True
+    for n_sents in sizes:
+        src, tgt = synthetic_section(n_sents, n_abstract, seed=seed)
+        ids_ref, t_ref = _timed(extoracle.utils.greedy_selection,
+                                src, tgt, n_abstract, repeat)
+        ids_new, t_new = _timed(extoracle.utils.incremental_greedy_selection,
+                                src, tgt, n_abstract, repeat)
+        same = same and ids_ref == ids_new
+        print("n_sents=%4d  greedy: %8.4fs  incremental: %8.4fs  "
+              "speedup: %6.1fx  same: %s"
+              % (n_sents, t_ref, t_new, t_ref / max(t_new, 1e-9),
+                 ids_ref == ids_new))
+    return same
+
+
+def benchmark_combination(sizes=(12, 18, 22), long_sizes=(50, 100, 200),
+                          n_abstract=4, time_budget=60, seed=0):
+    """Compare `combination_selection` and `bounded_combination_selection`
+
+    Brute force is only run on the small sections, where selections must
+    be identical; on long sections only the bounded search is timed
+    (falling back to greedy after `time_budget` seconds).
+    """
+    same = True
+    for n_sents in sizes:
+        src, tgt = synthetic_section(n_sents, n_abstract, vocab_size=300,
+                                     seed=seed)
+        ids_ref, t_ref = _timed(extoracle.utils.combination_selection,
+                                src, tgt, n_abstract, 1)
+        ids_new, t_new = _timed(extoracle.utils.bounded_combination_selection,
+                                src, tgt, n_abstract, 1)
+        same = same and ids_ref == ids_new
+        print("n_sents=%4d  combination: %8.4fs  bounded: %8.4fs  "
+              "speedup: %6.1fx  same: %s"
+              % (n_sents, t_ref, t_new, t_ref / max(t_new, 1e-9),
+                 ids_ref == ids_new))
+    for n_sents in long_sizes:
+        src, tgt = synthetic_section(n_sents, n_abstract, seed=seed)
+        t0 = time.time()
+        extoracle.utils.bounded_combination_selection(
+            src, tgt, n_abstract, max_nodes=None, time_budget=time_budget)
+        print("n_sents=%4d  bounded: %8.4fs" % (n_sents, time.time() - t0))
+    return same
+
+
+if __name__ == '__main__':
+    benchmark_greedy()
+    benchmark_combination()
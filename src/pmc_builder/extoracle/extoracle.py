@@ -5,12 +5,13 @@ Reference Code from:
     The following code have been modified as required
 '''
 import multiprocessing
+import threading
 import extoracle.utils
 
 
 METHODS = {
-    "greedy": extoracle.utils.greedy_selection,
-    "combination": extoracle.utils.combination_selection,
+    "greedy": extoracle.utils.incremental_greedy_selection,
+    "combination": extoracle.utils.bounded_combination_selection,
 }
 
 
@@ -43,9 +44,10 @@ def process_example(example):
     return ids, sents, key
 
 
-def from_imrd(src, tgt, method, summary_length=None,
-               length_oracle=False, n_thread=1):
-               
+SECTIONS = ["I", "M", "R", "D"]
+
+
+def get_method(method, summary_length, length_oracle):
     if method in METHODS:
         method = METHODS[method]
     else:
@@ -59,9 +61,22 @@ def from_imrd(src, tgt, method, summary_length=None,
     if summary_length is not None and length_oracle:
         raise ValueError(
             "Arguments [summary_length, length_oracle] are incompatible")
+    return method
+
+
+def process_section(example):
+    '''Same as `process_example`, without sending sentences back'''
+    ids, _, key = process_example(example)
+    return ids, key
+
+
+def from_imrd(src, tgt, method, summary_length=None,
+               length_oracle=False, n_thread=1):
+               
+    method = get_method(method, summary_length, length_oracle)
 
     def example_generator():
-        for key in ["I","M","R","D"]:
+        for key in SECTIONS:
             src_part, tgt_part = src[key], tgt[key]
             example = (
                 method,
@@ -74,6 +89,12 @@ def from_imrd(src, tgt, method, summary_length=None,
             yield example
     
     output = {}
+    if n_thread == 1:
+        for example in example_generator():
+            ids, key = process_section(example)
+            output[key] = ids
+        return output
+
     with multiprocessing.Pool(n_thread) as p:
         result_iterator = p.imap(process_example, example_generator())
 
@@ -84,6 +105,40 @@ def from_imrd(src, tgt, method, summary_length=None,
     return output
 
 
+def from_corpus(examples, method, summary_length=None,
+                length_oracle=False, n_thread=None, chunksize=8,
+                max_pending=4096):
+    '''Oracle labels for a stream of articles on one persistent pool
+
+    Args:
+        examples(iterable): (pmcid, src, tgt), src/tgt as in `from_imrd`
+        n_thread(int): number of worker processes (default: all cores)
+        chunksize(int): sections sent to a worker at once
+        max_pending(int): maximum sections read ahead of the results,
+                          bounds memory for arbitrarily long streams
+    Yields:
+        (pmcid, output): output as returned by `from_imrd`,
+                         in order of completion
+    '''
+    method = get_method(method, summary_length, length_oracle)
+    slots = threading.BoundedSemaphore(max(max_pending, chunksize))
 
+    def example_generator():
+        for pmcid, src, tgt in examples:
+            for key in SECTIONS:
+                slots.acquire()
+                yield (method, src[key], tgt[key], summary_length,
+                       length_oracle, (pmcid, key))
 
+    pending = {}
+    with multiprocessing.Pool(n_thread) as p:
+        result_iterator = p.imap_unordered(
+            process_section, example_generator(), chunksize)
 
+        for ids, (pmcid, key) in result_iterator:
+            slots.release()
+            output = pending.setdefault(pmcid, {})
+            output[key] = ids
+            if len(output) == len(SECTIONS):
+                del pending[pmcid]
+                yield pmcid, {key: output[key] for key in SECTIONS}
@@ -6,6 +6,7 @@ under:
 """
 import math
 import rouge
+import numpy as np
 from rouge.rouge_score import Ngrams
 
 
@@ -66,6 +67,127 @@ def greedy_selection(doc_sent_list, abstract_sent_list,
     return sorted(selected), sents
 
 
+class NgramScorer(object):
+    """Running ROUGE-n state of the selected sentences
+
+    Candidates are kept as a count matrix over integer n-gram ids, so the
+    ROUGE-n F score of adding every candidate to the current selection is
+    computed in one vectorized step. Scores are identical to ``cal_rouge``
+    over ``Ngrams.union`` of the same sentences.
+    """
+
+    def __init__(self, n, sents, abstract, exclusive_ngrams=False):
+        self.exclusive = exclusive_ngrams
+        sent_ngrams = [[tuple(sent[i:i + n]) for i in range(len(sent) - n + 1)]
+                       for sent in sents]
+        ref_ngrams = [tuple(abstract[i:i + n])
+                      for i in range(len(abstract) - n + 1)]
+
+        if exclusive_ngrams:
+            # sets: every distinct n-gram of the document is a column
+            vocab = {}
+            for ngrams in sent_ngrams:
+                for g in ngrams:
+                    vocab.setdefault(g, len(vocab))
+            ref = set(ref_ngrams)
+            self.in_ref = np.zeros(len(vocab), dtype=bool)
+            for g, idx in vocab.items():
+                self.in_ref[idx] = g in ref
+            self.matrix = np.zeros((len(sents), len(vocab)), dtype=bool)
+            self.selected = np.zeros(len(vocab), dtype=bool)
+            self.reference_count = len(ref)
+        else:
+            # lists: only reference n-grams can overlap, others only add length
+            vocab = {}
+            for g in ref_ngrams:
+                vocab.setdefault(g, len(vocab))
+            self.reference = np.zeros(len(vocab), dtype=np.int64)
+            for g in ref_ngrams:
+                self.reference[vocab[g]] += 1
+            self.matrix = np.zeros((len(sents), len(vocab)), dtype=np.int64)
+            self.selected = np.zeros(len(vocab), dtype=np.int64)
+            self.lengths = np.array([len(g) for g in sent_ngrams], dtype=np.int64)
+            self.selected_length = 0
+            self.reference_count = len(ref_ngrams)
+
+        for i, ngrams in enumerate(sent_ngrams):
+            for g in ngrams:
+                idx = vocab.get(g)
+                if idx is not None:
+                    if exclusive_ngrams:
+                        self.matrix[i, idx] = True
+                    else:
+                        self.matrix[i, idx] += 1
+
+    def counts(self):
+        """(evaluated, overlapping) counts when adding each candidate"""
+        if self.exclusive:
+            union = self.selected | self.matrix
+            return union.sum(1), (union & self.in_ref).sum(1)
+        overlap = np.minimum(self.selected + self.matrix, self.reference).sum(1)
+        return self.selected_length + self.lengths, overlap
+
+    def scores(self):
+        """ROUGE-n F score when adding each candidate (same formula as
+        rouge.rouge_score.f_r_p_rouge_n)"""
+        evaluated, overlap = self.counts()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(evaluated == 0, 0.0, overlap / evaluated)
+        if self.reference_count == 0:
+            recall = np.zeros(len(overlap))
+        else:
+            recall = overlap / self.reference_count
+        return 2.0 * ((precision * recall) / (precision + recall + 1e-8))
+
+    def add(self, i):
+        if self.exclusive:
+            self.selected |= self.matrix[i]
+        else:
+            self.selected += self.matrix[i]
+            self.selected_length += self.lengths[i]
+
+
+def incremental_greedy_selection(doc_sent_list, abstract_sent_list,
+                                 summary_size, exclusive_ngrams=False):
+    """Greedy ext-oracle scoring only the marginal step of each candidate
+
+    Same selections as `greedy_selection`, but the union of the selected
+    sentences is kept as running n-gram counts instead of being rebuilt
+    for every candidate at every step.
+
+    Args:
+        doc_sent_list(list): list of doc sentences (itself a list of words)
+        abstract_sent_list(list): list of abstract sentences
+                                  (itself a list of words)
+        summary_size(int): size of the summary, in sentences
+
+    Returns:
+        selected(list): list of selected sentences
+    """
+    max_rouge = 0.0
+    abstract = sum(abstract_sent_list, [])
+    abstract = _rouge_clean(' '.join(abstract)).split()
+    sents = [_rouge_clean(' '.join(s)).split() for s in doc_sent_list]
+    scorers = [NgramScorer(n, sents, abstract, exclusive_ngrams)
+               for n in (1, 2)]
+
+    selected = []
+    for s in range(summary_size):
+        if not sents:
+            return selected, sents
+        rouge_score = scorers[0].scores() + scorers[1].scores()
+        rouge_score[selected] = -np.inf
+        cur_id = int(np.argmax(rouge_score))
+        if not rouge_score[cur_id] > max_rouge:
+            return selected, sents
+        selected.append(cur_id)
+        max_rouge = rouge_score[cur_id]
+        for scorer in scorers:
+            scorer.add(cur_id)
+
+    return sorted(selected), sents
+
+
 def combination_selection(doc_sent_list, abstract_sent_list, summary_size,
                           exclusive_ngrams=False):
     """Combination ext-oracle on lists of sentences
@@ -118,6 +240,198 @@ def combination_selection(doc_sent_list, abstract_sent_list, summary_size,
     return sorted(list(max_idx)), sents
 
 
+def _f_score(overlapping_count, evaluated_count, reference_count):
+    """ROUGE-n F score, same formula as rouge.rouge_score.f_r_p_rouge_n"""
+    precision = 0.0 if evaluated_count == 0 \
+        else overlapping_count / evaluated_count
+    recall = 0.0 if reference_count == 0 \
+        else overlapping_count / reference_count
+    return 2.0 * ((precision * recall) / (precision + recall + 1e-8))
+
+
+def _ratio_bound(num, den, gains, lens, slots):
+    """max (num + sum(gains[S])) / (den + sum(lens[S])) over |S| <= slots
+
+    Solved exactly with Dinkelbach iterations; each step takes the
+    (at most `slots`) items with a positive gain - ratio * length.
+    """
+    ratio = num / den
+    while slots > 0 and len(gains):
+        value = gains - ratio * lens
+        idx = np.flatnonzero(value > 0)
+        if len(idx) == 0:
+            break
+        if len(idx) > slots:
+            idx = idx[np.argpartition(-value[idx], slots - 1)[:slots]]
+        new_ratio = (num + gains[idx].sum()) / (den + lens[idx].sum())
+        if new_ratio <= ratio:
+            break
+        ratio = new_ratio
+    return ratio
+
+
+class _Budget(Exception):
+    pass
+
+
+def bounded_combination_selection(doc_sent_list, abstract_sent_list,
+                                  summary_size, exclusive_ngrams=False,
+                                  max_nodes=100000, time_budget=None):
+    """Branch-and-bound version of `combination_selection`
+
+    Searches the same combinations (sizes ceil(k/2)+1 .. k+1) and returns
+    the same optimum, resolving ties in the brute-force enumeration order.
+    In the default non-exclusive mode, sentences without any reference
+    n-gram are dropped up front: when a combination needs more sentences
+    than remain, it is filled with the shortest of them, which is optimal
+    since they only add length. Subtrees are pruned with an upper bound on
+    ROUGE-1 + ROUGE-2 using, for ROUGE-n, F <= 2 * overlap / (evaluated +
+    reference), the remaining candidates' marginal overlap (capped by the
+    unmatched reference counts) and their lengths.
+
+    Args:
+        doc_sent_list(list): list of doc sentences (itself a list of words)
+        abstract_sent_list(list): list of abstract sentences
+                                  (itself a list of words)
+        summary_size(int): size of the summary, in sentences
+        max_nodes(int): search node budget (None for unlimited)
+        time_budget(float): search time budget in seconds (None for unlimited)
+
+    Returns:
+        selected(list): list of selected sentences, or the greedy selection
+                        if the budget is exhausted
+    """
+    import time
+
+    abstract = sum(abstract_sent_list, [])
+    abstract = _rouge_clean(' '.join(abstract)).split()
+    sents = [_rouge_clean(' '.join(s)).split() for s in doc_sent_list]
+    scorers = [NgramScorer(n, sents, abstract, exclusive_ngrams)
+               for n in (1, 2)]
+    n_sents = len(sents)
+
+    if exclusive_ngrams:
+        own = [(s.matrix & s.in_ref).sum(1) for s in scorers]
+        lens = [s.matrix.sum(1) for s in scorers]
+    else:
+        own = [np.minimum(s.matrix, s.reference).sum(1) for s in scorers]
+        lens = [s.lengths for s in scorers]
+
+    # explore the most promising sentences first
+    order = sorted(range(n_sents), key=lambda i: (
+        -sum(_f_score(int(o[i]), int(l[i]), s.reference_count)
+             for o, l, s in zip(own, lens, scorers)), i))
+    if exclusive_ngrams:
+        cands, zeros = order, []
+    else:
+        cands = [i for i in order if own[0][i] > 0]
+        zeros = sorted((i for i in range(n_sents) if own[0][i] == 0),
+                       key=lambda i: (len(sents[i]), i))
+    zero_lens = [np.concatenate([[0], np.cumsum(l[zeros])]).astype(int)
+                 for l in lens]
+    n_cands = len(cands)
+
+    min_size = math.ceil(summary_size / 2) + 1
+    max_size = min(summary_size + 1, n_sents)
+    best = {'score': 0.0, 'key': None}
+    selected = [np.zeros(s.matrix.shape[1], dtype=np.int64) for s in scorers]
+    state = {'nodes': 0, 'start': time.time()}
+
+    selected_len = [0] * len(scorers)
+
+    def counts():
+        """(overlapping, evaluated) counts of the chosen sentences"""
+        res = []
+        for k, (s, sel) in enumerate(zip(scorers, selected)):
+            if exclusive_ngrams:
+                mask = sel > 0
+                res.append((int((mask & s.in_ref).sum()), int(mask.sum())))
+            else:
+                res.append((int(np.minimum(sel, s.reference).sum()),
+                            selected_len[k]))
+        return res
+
+    def evaluate(chosen, ov_ev):
+        if not chosen:
+            return
+        for size in range(max(min_size, len(chosen)),
+                          min(max_size, len(chosen) + len(zeros)) + 1):
+            j = size - len(chosen)
+            score = sum(_f_score(ov, ev + int(zl[j]), s.reference_count)
+                        for (ov, ev), zl, s in zip(ov_ev, zero_lens, scorers))
+            if score < best['score']:
+                continue
+            key = (size, tuple(sorted(chosen + zeros[:j])))
+            if score > best['score'] or (best['key'] is not None
+                                         and key < best['key']):
+                best['score'], best['key'] = score, key
+
+    def bound(pos, chosen, ov_ev):
+        slots = max_size - len(chosen)
+        rest = cands[pos:]
+        total = 0.0
+        for (ov, ev), s, sel, l in zip(ov_ev, scorers, selected, lens):
+            ref = s.reference_count
+            if ref == 0:
+                continue
+            if exclusive_ngrams:
+                gains = (s.matrix[rest] & s.in_ref & (sel == 0)).sum(1)
+                top = np.sort(gains)[::-1][:slots].sum() if slots > 0 else 0
+                total += 2.0 * min(ref, ov + top) / (ev + ref)
+                continue
+            capacity = np.maximum(s.reference - sel, 0)
+            gains = np.minimum(s.matrix[rest], capacity).sum(1)
+            ratio = _ratio_bound(ov, ev + ref, gains, l[rest], slots)
+            total += 2.0 * min(ratio, ref / (ev + ref))
+        return total
+
+    def add(i, sign):
+        for k, (s, sel) in enumerate(zip(scorers, selected)):
+            sel += sign * s.matrix[i]
+            selected_len[k] += sign * int(lens[k][i])
+
+    def search(pos, chosen):
+        state['nodes'] += 1
+        if (max_nodes is not None and state['nodes'] > max_nodes) or \
+                (time_budget is not None
+                 and time.time() - state['start'] > time_budget):
+            raise _Budget()
+        ov_ev = counts()
+        evaluate(chosen, ov_ev)
+        if len(chosen) >= max_size or pos >= n_cands:
+            return
+        if bound(pos, chosen, ov_ev) + 1e-9 < best['score']:
+            return
+        for q in range(pos, n_cands):
+            if len(chosen) + len(zeros) + (n_cands - q) < min_size:
+                break
+            i = cands[q]
+            add(i, 1)
+            chosen.append(i)
+            search(q + 1, chosen)
+            chosen.pop()
+            add(i, -1)
+
+    # incumbent: the greedy oracle grown to the largest allowed size
+    seed, _ = incremental_greedy_selection(doc_sent_list, abstract_sent_list,
+                                           max_size, exclusive_ngrams)
+    seed = [i for i in seed if own[0][i] > 0]
+    for i in seed:
+        add(i, 1)
+    evaluate(seed, counts())
+    for i in seed:
+        add(i, -1)
+
+    try:
+        search(0, [])
+    except _Budget:
+        return incremental_greedy_selection(
+            doc_sent_list, abstract_sent_list, summary_size, exclusive_ngrams)
+
+    max_idx = best['key'][1] if best['key'] is not None else (0, 0)
+    return sorted(list(max_idx)), sents
+
+
 def cal_rouge(evaluated_ngrams, reference_ngrams):
     reference_count = len(reference_ngrams)
     evaluated_count = len(evaluated_ngrams)
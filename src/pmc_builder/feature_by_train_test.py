@@ -5,6 +5,9 @@ Merge parquet files according to the pmcid of train/test
 
 import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
 
 
 def read_pmcids(path):
@@ -17,15 +20,61 @@ def read_df(path):
     df = pd.read_parquet(path)
     return df
 
-def main(rf, rd, od, fileName):
-    pmcids = read_pmcids(rf)
-    result = []
+# 單篇文章 (加上 pmcid 及句子於文章中之索引)
+def read_table(path, pmcid):
+    table = pq.read_table(path).replace_schema_metadata(None)
+    n = table.num_rows
+    table = table.add_column(0, 'sent_idx', pa.array(range(n), type=pa.int32()))
+    table = table.add_column(0, 'pmcid', pa.array([pmcid] * n, type=pa.string()))
+    return table
+
+# 依序讀取文章, 每累積 row_group_size 列輸出一批 (記憶體用量與資料集大小無關)
+def iter_batches(rd, pmcids, schema, row_group_size, missing):
+    buffer, rows = [], 0
     for i in pmcids:
-        df = read_df("%s%s.parquet"%(rd,i))
-        result.append(df)
-    result = pd.concat(result, axis=0, ignore_index=True)
-    result.to_parquet('%s%s.parquet'%(od, fileName))
-    print(result.info())
+        path = "%s%s.parquet"%(rd, i)
+        if not os.path.exists(path):
+            missing.append(i)
+            continue
+        table = read_table(path, i).cast(schema)
+        buffer.append(table)
+        rows += table.num_rows
+        if rows >= row_group_size:
+            table = pa.concat_tables(buffer)
+            while table.num_rows >= row_group_size:
+                yield table.slice(0, row_group_size)
+                table = table.slice(row_group_size)
+            buffer, rows = [table], table.num_rows
+    if rows:
+        yield pa.concat_tables(buffer)
+
+# partition_cols: 輸出為分區資料集目錄 (例如 ['section']), 可直接以 pd.read_parquet 讀取
+def main(rf, rd, od, fileName, row_group_size=1000000, partition_cols=None):
+
+    if not os.path.exists(od):
+        os.makedirs(od)
+
+    pmcids = [i for i in read_pmcids(rf) if i]
+    first = next(i for i in pmcids if os.path.exists("%s%s.parquet"%(rd, i)))
+    schema = read_table("%s%s.parquet"%(rd, first), first).schema
+    missing = []
+    batches = iter_batches(rd, pmcids, schema, row_group_size, missing)
+
+    if partition_cols:
+        path = '%s%s'%(od, fileName)
+        ds.write_dataset((batch for table in batches for batch in table.to_batches()), path,
+                         schema=schema, format='parquet', partitioning=partition_cols, partitioning_flavor='hive',
+                         max_rows_per_group=row_group_size, existing_data_behavior='delete_matching')
+    else:
+        path = '%s%s.parquet'%(od, fileName)
+        with pq.ParquetWriter(path + '.part', schema) as writer:
+            for table in batches:
+                writer.write_table(table, row_group_size=row_group_size)
+        os.replace(path + '.part', path)
+
+    print(schema)
+    print('rows: %d, articles: %d, missing: %d'%(ds.dataset(path, partitioning='hive' if partition_cols else None).count_rows(),
+                                                 len(pmcids) - len(missing), len(missing)))
 
 
 
@@ -37,4 +86,4 @@ if __name__ == "__main__":
     file_name = 'train'
     
     # main(input_file, input_dir, output_dir, file_name)
-
+    # main(input_file, input_dir, output_dir, file_name, partition_cols=['section'])
@@ -5,19 +5,30 @@ and export it as a parquet file
 '''
 
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sentence_transformers import SentenceTransformer, util
+from sentence_embedding import EmbeddingService, MODELS, centrality
+import pyarrow.parquet as pq
 import pandas as pd
 import numpy as np
-import torch
-import spacy
+import multiprocessing
 import json
 import re
 import os
+from collections import namedtuple
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module='sklearn.feature_extraction.text')
 
 
-nlp = spacy.load("en_core_sci_sm")
+# 延遲載入 spaCy (使用 preprocess_json 保存之 token 屬性時不需載入)
+_nlp = None
+def nlp(txt):
+    global _nlp
+    if _nlp is None:
+        import spacy
+        _nlp = spacy.load("en_core_sci_sm")
+    return _nlp(txt)
+
+# 保存之 token 屬性 (與 spaCy token 相同之屬性名稱)
+Token = namedtuple('Token', ['lower_', 'lemma_', 'pos_', 'is_stop', 'is_punct', 'is_digit'])
 
 def get_file(path):
     for file in os.listdir(path):
@@ -52,16 +63,15 @@ def position_imp(cur, ns):
     imp = 1 if cur == 1 else (ns-cur)/ns
     return imp
 
-# 標題詞列表
+# 標題詞集合 (txt 為字串或已分析之 token 序列)
 def title_wlst(txt):
-    doc = nlp(txt)
-    wlst = [token.text.lower() for token in clean_token(doc)]
-    return list(set(wlst))
+    doc = nlp(txt) if isinstance(txt, str) else txt
+    return {token.lower_ for token in clean_token(doc)}
 
-# 句子之標題詞數量
+# 句子之標題詞數量 (wlst: 標題詞集合)
 def title_word_count(doc, wlst):
     titleLen = len(wlst)
-    score = 0 if titleLen == 0 else len([token for token in doc if token.text.lower() in wlst])/titleLen
+    score = 0 if titleLen == 0 else len([token for token in doc if token.lower_ in wlst])/titleLen
     return score
 
 # 標記詞性之數量
@@ -70,90 +80,203 @@ def pos_token(doc, pos_type):
 
 # 自定分詞器
 def custom_toknizer(txt):
-    doc = nlp(txt)
+    doc = nlp(txt) if isinstance(txt, str) else txt
     words = [token.lemma_.lower() for token in doc if not (token.is_stop or token.is_punct or token.is_digit)]
     return words
 
-# 詞頻-逆向句子頻率 
+# 詞頻-逆向句子頻率 (lst 為句子字串或已分析之 token 序列)
 def Tfisf(lst):
-    tf = TfidfVectorizer(tokenizer=custom_toknizer, lowercase=False)
+    tf = TfidfVectorizer(analyzer=custom_toknizer)
     tfisf_matrix = tf.fit_transform(lst)
     word_count = (tfisf_matrix!=0).sum(1)
     with np.errstate(divide='ignore', invalid='ignore'):
         mean_score = np.where(word_count == 0, 0, np.divide(tfisf_matrix.sum(1), word_count)).flatten()
     return mean_score
 
+# 句向量服務 (每個 process 各模型只載入一次)
+EMBEDDINGS = EmbeddingService()
+
 # 餘弦相似度
 def similarity(lst, ptm):
-    model = SentenceTransformer(ptm)
-    embeddings = model.encode(lst, convert_to_tensor=True)
-    cosine = util.cos_sim(embeddings, embeddings)
-    cosine = cosine.sum(1)-1
-    cosine = torch.divide(cosine, torch.max(cosine)).numpy() # .cpu().numpy()
-    return cosine
-
-# 特徵萃取
-def feature_extraction(title, section, sents): 
+    return centrality(EMBEDDINGS.encode(lst, ptm))
+
+# 特徵欄位及類型 (parquet schema)
+COLUMNS = ['section', 'F1', 'F2', 'F3', 'F4', 'F5', 'F6', 'F7', 'F8', 'F9', 'F10', 'label']
+DTYPES = dict({'section': 'int8', 'label': 'bool'}, **{'F%d'%i: 'float32' for i in range(1, 11)})
+
+# 位置重要性 (向量化)
+def position_imp_array(cur, ns):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(cur == 1, 1.0, (ns-cur)/ns)
+
+# 特徵萃取 (docs: 每句之 token 序列, 未提供時以 spaCy 分析), 回傳各欄位之 numpy array
+def feature_extraction(title, section, sents, docs=None): 
     lst = sent_lst(sents)
-    tfisf = Tfisf(lst)
-    cosine = [similarity(lst, "sentence-transformers/all-MiniLM-L6-v2"),
-              similarity(lst, "pritamdeka/BioBERT-mnli-snli-scinli-scitail-mednli-stsb"),
-              similarity(lst, "pritamdeka/PubMedBERT-mnli-snli-scinli-scitail-mednli-stsb")
-              ]
+    docs = [nlp(txt) for txt in lst] if docs is None else docs
     # Number of sentences
     ns = len(sents)
+    cols = {c: np.empty(ns, dtype=DTYPES[c]) for c in COLUMNS}
+    if ns == 0:
+        return cols
+    title = title if isinstance(title, (set, frozenset)) else set(title)
+    tfisf = np.asarray(Tfisf(docs)).ravel()
+    cosine = [similarity(lst, ptm) for ptm in MODELS]   # MiniLM, BioBERT, PubMedBERT
     sents = add_num_sents_para(sents)
-    # Extracting the features of each sentences
-    arr = np.empty((0,12))
-    for index, sent in enumerate(sents):
-        doc = nlp(sent["text"])
+    # Token counts of each sentence (length, title word, proper noun, numerical token)
+    counts = np.zeros((ns, 4), dtype=np.int64)
+    for index, doc in enumerate(docs):
         doc = clean_token(doc)
-         
-        label = sent["label"]
-        F1 = len(doc)                                           # Sentence Length (undone) -> len / longest sentence len
-        F2 = position_imp(sent["pos"], ns)                      # Sentence Position
-        F3 = position_imp(sent["pos_para"], sent["ns_para"])    # Sentence Position (in paragraph)
-        F4 = title_word_count(doc, title)                       # Title Word
-        F5 = 0 if F1 == 0 else pos_token(doc, "PROPN")/F1       # Proper Noun
-        F6 = 0 if F1 == 0 else pos_token(doc, "NUM")/F1         # Numerical Token
-        F7 = tfisf[index]                                       # Term Frequency-Inverse Sentence Frequency
-        F8, F9, F10 = [x[index] for x in cosine]                # Cosine Similarity
-
-        feat = np.array([[section, F1, F2, F3, F4, F5, F6, F7, F8, F9, F10, label]])
-        arr = np.append(arr, feat, axis=0)
-    # F1 (cont.)
-    maxLen = np.amax(arr[:,1])
-    arr[:,1] = arr[:,1]/maxLen 
-    return arr
+        counts[index] = (len(doc),
+                         sum(token.lower_ in title for token in doc),
+                         sum(token.pos_ == "PROPN" for token in doc),
+                         sum(token.pos_ == "NUM" for token in doc))
+    length = counts[:, 0].astype(np.float64)
+    pos = np.array([sent["pos"] for sent in sents], dtype=np.float64)
+    pos_para = np.array([sent["pos_para"] for sent in sents], dtype=np.float64)
+    ns_para = np.array([sent["ns_para"] for sent in sents], dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cols['section'][:] = section
+        cols['F1'][:] = length / length.max()                                   # Sentence Length / longest sentence length
+        cols['F2'][:] = position_imp_array(pos, ns)                             # Sentence Position
+        cols['F3'][:] = position_imp_array(pos_para, ns_para)                   # Sentence Position (in paragraph)
+        cols['F4'][:] = counts[:, 1] / len(title) if title else 0               # Title Word
+        cols['F5'][:] = np.where(length == 0, 0, counts[:, 2] / length)         # Proper Noun
+        cols['F6'][:] = np.where(length == 0, 0, counts[:, 3] / length)         # Numerical Token
+        cols['F7'][:] = tfisf                                                   # Term Frequency-Inverse Sentence Frequency
+        cols['F8'][:], cols['F9'][:], cols['F10'][:] = cosine                   # Cosine Similarity
+    cols['label'][:] = [bool(sent["label"]) for sent in sents]
+    return cols
     
-# 文章 IMRD - 句子特徵
-def feature_from_imrd(body, title):
-    paper = np.empty((0,12))
+# 文章 IMRD - 句子特徵 (tokens: read_tokens 之各章節 token 序列)
+def feature_from_imrd(body, title, tokens=None):
+    title = set(title)
+    parts = []
     for index, key in enumerate(['I', 'M', 'R', 'D'], start = 1):
-        paper = np.append(paper, feature_extraction(title, index, body[key]), axis = 0)
-    df = pd.DataFrame(paper, columns = ['section','F1', 'F2', 'F3', 'F4', 'F5', 'F6', 'F7', 'F8', 'F9', 'F10', 'label'])
-    return set_dtypes(df)
+        docs = None if tokens is None else [tokens[key].get(j, []) for j in range(len(body[key]))]
+        parts.append(feature_extraction(title, index, body[key], docs))
+    return pd.DataFrame({c: np.concatenate([part[c] for part in parts]) for c in COLUMNS})
+
+# 讀取 token 屬性 (preprocess_json 輸出), 回傳標題 token 與各章節每句之 token
+def read_tokens(path):
+    df = pd.read_parquet(path)
+    title, tokens = [], {key: {} for key in ['I', 'M', 'R', 'D']}
+    cols = [df[c].tolist() for c in ['section', 'sent', 'lower', 'lemma', 'pos', 'is_stop', 'is_punct', 'is_digit']]
+    for key, j, *attrs in zip(*cols):
+        token = Token(*attrs)
+        if key == 'T':
+            title.append(token)
+        else:
+            tokens[key].setdefault(j, []).append(token)
+    return title, tokens
 
 # 設置欄位類型
 def set_dtypes(df):
-    df = df.astype({'section': 'int8', 'label': 'bool',
-                    'F1': 'float32', 'F2': 'float32', 'F3': 'float32', 'F4': 'float32', 'F5': 'float32',
-                    'F6': 'float32', 'F7': 'float32', 'F8': 'float32', 'F9': 'float32', 'F10': 'float32'})
-    return df
+    return df.astype(DTYPES)
 
-#
-def main(rd, od):
+# 分批 (跨文章一次編碼句向量)
+def chunked(items, chunk_size):
+    for i in range(0, len(items), chunk_size):
+        yield items[i:i+chunk_size]
+
+# 輸出檔是否完整 (可讀取且欄位齊全)
+def valid_output(path):
+    try:
+        names = pq.read_schema(path).names
+    except Exception:
+        return False
+    return set(COLUMNS) <= set(names)
+
+# 寫入暫存檔後更名 (中斷時不會留下不完整之 parquet)
+def save_parquet(df, path):
+    tmp = path + '.part'
+    df.to_parquet(tmp)
+    os.replace(tmp, path)
+
+# 單篇文章特徵
+def extract_article(rd, od, td, pmcid, sentJson):
+    body = sentJson['body']
+    if td:
+        title, tokens = read_tokens('%s%s.parquet'%(td, pmcid))
+        title = title_wlst(title)
+    else:
+        title, tokens = title_wlst(sentJson['title']), None
+    result = feature_from_imrd(body, title, tokens)
+    save_parquet(result, '%s%s.parquet'%(od, pmcid))
+
+# worker 設定 (spaCy 與句向量模型於各 process 首次使用時載入一次)
+_config = {}
+def init_worker(rd, od, td, cache_dir, n_threads=None):
+    _config.update(rd=rd, od=od, td=td)
+    EMBEDDINGS.cache_dir = cache_dir
+    if n_threads:
+        try:
+            import torch
+            torch.set_num_threads(n_threads)
+        except ImportError:
+            pass
+
+# 處理一批文章, 回傳 [(pmcid, 錯誤訊息 or None)]
+def process_chunk(files):
+    rd, od, td = _config['rd'], _config['od'], _config['td']
+    chunk, status = [], []
+    for file in files:
+        pmcid = file.split('.')[0]
+        try:
+            chunk.append((pmcid, sent_json('%s%s'%(rd, file))))
+        except Exception as e:
+            status.append((pmcid, '%s: %s'%(type(e).__name__, e)))
+    try:
+        EMBEDDINGS.prefetch([sent['text'] for _, sentJson in chunk
+                             for key in ['I', 'M', 'R', 'D'] for sent in sentJson['body'][key]])
+    except Exception as e:
+        print('prefetch failed, encoding per article:', e)
+    for pmcid, sentJson in chunk:
+        try:
+            extract_article(rd, od, td, pmcid, sentJson)
+            status.append((pmcid, None))
+        except Exception as e:
+            status.append((pmcid, '%s: %s'%(type(e).__name__, e)))
+    EMBEDDINGS.clear()
+    return status
+
+# td: preprocess_json 保存之 token 屬性目錄 (提供時不載入 spaCy)
+# cache_dir: 句向量快取目錄 (float16 memmap, 重新萃取特徵時不需再次編碼)
+# n_process: worker 數量, 已存在且完整之輸出會略過 (可中斷後續跑)
+# log: 失敗紀錄 (pmcid\terror), 預設為 od 旁之 .errors.tsv
+def main(rd, od, td=None, cache_dir=None, chunk_size=64, n_process=1, overwrite=False, log=None):
     
     if not os.path.exists(od):      
         os.makedirs(od)
 
-    for file in get_file(rd):
-        pmcid = file.split('.')[0]
-        sentJson = sent_json('%s%s'%(rd, file))
-        title = title_wlst(sentJson['title'])
-        body = sentJson['body']
-        result = feature_from_imrd(body, title)
-        result.to_parquet('%s%s.parquet'%(od, pmcid))
+    files = list(get_file(rd))
+    todo = [file for file in files if overwrite or not valid_output('%s%s.parquet'%(od, file.split('.')[0]))]
+    n_threads = max(1, (os.cpu_count() or 1) // n_process) if n_process > 1 else None
+    args = (rd, od, td, cache_dir, n_threads)
+    done = failed = 0
+    with open(log or od.rstrip('/') + '.errors.tsv', 'a') as errors:
+        if n_process > 1:
+            pool = multiprocessing.Pool(n_process, initializer=init_worker, initargs=args)
+            results = pool.imap_unordered(process_chunk, list(chunked(todo, chunk_size)))
+        else:
+            pool = None
+            init_worker(*args)
+            results = map(process_chunk, chunked(todo, chunk_size))
+        try:
+            for status in results:
+                for pmcid, error in status:
+                    if error is None:
+                        done += 1
+                        continue
+                    failed += 1
+                    print(pmcid, error)
+                    errors.write('%s\t%s\n'%(pmcid, error.replace('\n', ' ')))
+                    errors.flush()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+    print('done: %d, failed: %d, skipped: %d'%(done, failed, len(files) - len(todo)))
 
 
 
@@ -163,3 +286,5 @@ if __name__ == '__main__':
     output_dir = 'dataset/sentence_features/'
     
     # main(input_dir, output_dir)
+    # main(input_dir, output_dir, td='dataset/sentence_tokens/', cache_dir='dataset/embedding_cache/')
+    # main(input_dir, output_dir, td='dataset/sentence_tokens/', cache_dir='dataset/embedding_cache/', n_process=8)
@@ -5,13 +5,31 @@ Add the following attributes to the sentences of each section
 '''
 
 import spacy
+import pandas as pd
 import json
+import time
 import re
 import os
+import queue
+import threading
 import extoracle
+from collections import deque
+from crawler.json_store import iter_papers
 
 
-nlp = spacy.load("en_core_sci_sm")
+# 斷句只需要 tokenizer, tok2vec, parser
+SEGMENT_DISABLE = ['tagger', 'attribute_ruler', 'lemmatizer', 'ner']
+# 保存 token 屬性時另需 tagger, attribute_ruler, lemmatizer (POS, lemma)
+TOKEN_DISABLE = ['ner']
+TOKEN_COLUMNS = ['section', 'sent', 'lower', 'lemma', 'pos', 'is_stop', 'is_punct', 'is_digit']
+
+# 延遲載入 spaCy pipeline (依停用元件快取)
+_nlp = {}
+def load_nlp(disable=()):
+    key = tuple(disable)
+    if key not in _nlp:
+        _nlp[key] = spacy.load("en_core_sci_sm", disable=list(disable))
+    return _nlp[key]
 
 def get_file(path):
     for file in os.listdir(path):
@@ -28,15 +46,22 @@ def raw_json(path):
 def rm_parenthese_with_useless_token(text):
     return re.sub(r'\s*\(\s*(?:table|fig|http|www)[^()]*\)', '', text, flags = re.I)  # re.I 不區分大小寫
 
+# 段落前處理
+def clean_paragraph(i):
+    return rm_parenthese_with_useless_token(i).strip() # 避免末端空白判斷為 token 而無法 sents_break
+
 # 斷句
 def sents_segment(p, pos_para = False):
+    nlp = load_nlp()
+    return sents_from_docs((nlp(clean_paragraph(i)) for i in p), pos_para)
+
+# 斷句 (已分析之段落 doc), spans 不為 None 時一併收集每句之 token span
+def sents_from_docs(docs, pos_para = False, spans = None):
     sents = []
     sents_break = [".", "?", "!"]
     start = para_i = pre_para_i =  0
     conn = False
-    for i in p:
-        i = rm_parenthese_with_useless_token(i).strip() # 避免末端空白判斷為 token 而無法 sents_break
-        doc = nlp(i)
+    for doc in docs:
         for sent in doc.sents:
             if any(t in sents_break for t in sent[-1].text): # 部分句尾詞如 3h. 無法分詞, 因此包含 sents_break 即可  
                 para_i +=1          
@@ -45,6 +70,7 @@ def sents_segment(p, pos_para = False):
                 sentence = {"text":text, "tokenize_text":tokenize_text, "pos":pre_para_i+para_i}    # 建立句子物件
                 if pos_para: sentence['pos_para'] = para_i                                          # pos 句子位置, pos_para 句子於每段位置
                 sents.append(sentence)
+                if spans is not None: spans.append(doc[start:sent.end])
                 start = sent.end
                 conn = False
             else:      
@@ -66,6 +92,68 @@ def sent2Json(paper):
         sentJson['body'][i] = sents_segment(paper['body'][i], True)
     return sentJson
 
+# 批次斷句 - 多篇文章之段落串流至 nlp.pipe (可多行程), 輸出與 sent2Json 相同
+# tokens=True 時另回傳標題與正文句子之 token 屬性表 (token_table)
+def sent2Json_stream(papers, n_process=1, batch_size=256, tokens=False):
+    nlp = load_nlp(TOKEN_DISABLE if tokens else SEGMENT_DISABLE)
+    pending = deque()
+
+    def paragraphs():
+        for paper in papers:
+            pending.append(paper)
+            if tokens:
+                yield paper['title'] or '', ('title', '')
+            for part in ['abstract', 'body']:
+                for i in section:
+                    for p in paper[part][i]:
+                        yield clean_paragraph(p), (part, i)
+            yield '', None          # 文章結束標記
+
+    docs = {}
+    for doc, ctx in nlp.pipe(paragraphs(), as_tuples=True, batch_size=batch_size, n_process=n_process):
+        if ctx is not None:
+            docs.setdefault(ctx, []).append(doc)
+            continue
+        paper = pending.popleft()
+        sentJson = {'title':paper['title'], 'abstract':{}, 'body':{}}
+        spans = {i: [] for i in section} if tokens else {}
+        for i in section:
+            sentJson['abstract'][i] = sents_from_docs(docs.get(('abstract', i), []))
+            sentJson['body'][i] = sents_from_docs(docs.get(('body', i), []), True, spans.get(i))
+        table = token_table(docs[('title', '')][0], spans) if tokens else None
+        docs = {}
+        yield paper, sentJson, table
+
+# token 屬性表 - section: 'T'(標題) 或 IMRD, sent: 句子於章節之索引 (pos - 1)
+def token_table(title, spans):
+    rows = [('T', 0, t.lower_, t.lemma_, t.pos_, t.is_stop, t.is_punct, t.is_digit) for t in title]
+    rows += [(i, j, t.lower_, t.lemma_, t.pos_, t.is_stop, t.is_punct, t.is_digit)
+             for i in section for j, span in enumerate(spans[i]) for t in span]
+    df = pd.DataFrame(rows, columns=TOKEN_COLUMNS)
+    return df.astype({'section': 'category', 'sent': 'int32', 'lower': 'string', 'lemma': 'string',
+                      'pos': 'category', 'is_stop': 'bool', 'is_punct': 'bool', 'is_digit': 'bool'})
+
+# 斷句效能比較 (articles/sec), 並確認兩種方式輸出一致
+def benchmark(rd, n=200, n_process=4, batch_size=256):
+    papers = []
+    for paper in iter_papers(rd):
+        papers.append(paper)
+        if len(papers) == n:
+            break
+    load_nlp()
+    load_nlp(SEGMENT_DISABLE)
+
+    t0 = time.time()
+    base = [json.dumps(sent2Json(paper)) for paper in papers]
+    t1 = time.time()
+    fast = [json.dumps(sentJson) for _, sentJson, _ in sent2Json_stream(papers, n_process, batch_size)]
+    t2 = time.time()
+
+    print("sent2Json       : %8.2f articles/sec" % (len(papers) / (t1 - t0)))
+    print("sent2Json_stream: %8.2f articles/sec (n_process=%d, batch_size=%d)" % (len(papers) / (t2 - t1), n_process, batch_size))
+    print("identical output:", base == fast)
+    return base == fast
+
 # 分詞之句子 - input as ext-oracle(source & target)
 def sentences_token(sentJson):
     src, tgt = {}, {}
@@ -81,35 +169,87 @@ def exception_detect(sentJson):
     return False
 
 #
-def main(rd, od, label = False):
+# td: token 屬性輸出目錄 (feature_extractor 可直接讀取, 不需再次載入 spaCy)
+# n_thread: oracle 標籤之 worker 數 (整個語料共用一個 pool)
+def main(rd, od, label = False, n_process = 1, batch_size = 256, td = None, n_thread = None):
     
     if not os.path.exists(od):      
         os.makedirs(od)
+    if td and not os.path.exists(td):
+        os.makedirs(td)
 
     # 摘要句標籤
-    def add_label(i):
+    def add_label(sentJson, ext_sentence, i):
         for j, sent in enumerate(sentJson['body'][i]):
             pos = sent['pos'] - 1
             sentJson['body'][i][j]['label'] = 1 if pos in ext_sentence[i] else 0
 
-    for file in get_file(rd):
-        rawJson = raw_json(rd + file)
-        sentJson = sent2Json(rawJson)
-        # 例外處理
-        if exception_detect(sentJson):
-            print(rawJson['id'])
-            continue
-        # 計算 oracle 摘要句標籤
-        if label:
-            src, tgt = sentences_token(sentJson)
-            ext_sentence = extoracle.from_imrd(src, tgt, 'greedy', length_oracle = True)
-            for i in section:
-                add_label(i)
-        
+    # 輸出
+    def save(pmcid, sentJson, tokens):
         paper = json.dumps(sentJson)
-        with open(od + rawJson['id'] + '.json', 'w') as f:
+        with open(od + pmcid + '.json', 'w') as f:
             f.write(paper)
+        if td:
+            tokens.to_parquet(td + pmcid + '.parquet')
+
+    def articles():
+        papers = iter_papers(rd)            # 單檔 json 目錄或 JSONL.gz 分片
+        for rawJson, sentJson, tokens in sent2Json_stream(papers, n_process, batch_size, tokens = bool(td)):
+            # 例外處理
+            if exception_detect(sentJson):
+                print(rawJson['id'])
+                continue
+            yield rawJson['id'], sentJson, tokens
+
+    if not label:
+        for pmcid, sentJson, tokens in articles():
+            save(pmcid, sentJson, tokens)
+        return
 
+    # 計算 oracle 摘要句標籤
+    # from_corpus 之輸入由 pool 的 task-handler 執行緒讀取, spaCy (n_process > 1 時會 fork) 不可在該執行緒執行:
+    # 斷句在主執行緒, 經由 bounded queue 交給標籤執行緒
+    pending, examples, errors = {}, queue.Queue(maxsize = 4 * batch_size), []
+
+    def from_queue():
+        while True:
+            item = examples.get()
+            if item is None:
+                return
+            yield item
+
+    def labeling():
+        try:
+            for pmcid, ext_sentence in extoracle.from_corpus(from_queue(), 'greedy', length_oracle = True, n_thread = n_thread):
+                sentJson, tokens = pending.pop(pmcid)
+                for i in section:
+                    add_label(sentJson, ext_sentence, i)
+                save(pmcid, sentJson, tokens)
+        except BaseException as e:
+            errors.append(e)
+
+    # 標籤執行緒中止時不再等待 queue
+    def put(item):
+        while True:
+            try:
+                return examples.put(item, timeout = 1)
+            except queue.Full:
+                if not worker.is_alive():
+                    raise errors[0] if errors else RuntimeError('labeling thread stopped')
+
+    worker = threading.Thread(target = labeling, daemon = True)
+    worker.start()
+    try:
+        for pmcid, sentJson, tokens in articles():
+            pending[pmcid] = (sentJson, tokens)
+            src, tgt = sentences_token(sentJson)
+            put((pmcid, src, tgt))
+    finally:
+        if worker.is_alive():
+            put(None)
+    worker.join()
+    if errors:
+        raise errors[0]
 
 if __name__ == '__main__':
     
@@ -118,3 +258,6 @@ if __name__ == '__main__':
     add_label = True
     
     # main(input_dir, output_dir, lable = add_label)
+    # main(input_dir, output_dir, label = add_label, n_process = 4, n_thread = 8)
+    # main(input_dir, output_dir, label = add_label, n_process = 4, td = 'dataset/sentence_tokens/')
+    # benchmark(input_dir, n = 200, n_process = 4)
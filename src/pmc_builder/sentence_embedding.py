@@ -0,0 +1,166 @@
+'''
+Sentence embedding service for the similarity features (F8-F10)
+Each model is loaded once per process, sentences are encoded in large batches
+and embeddings are cached on disk (memory-mapped float16, keyed by sentence hash and model)
+'''
+
+import numpy as np
+import hashlib
+import os
+
+
+MODELS = ["sentence-transformers/all-MiniLM-L6-v2",
+          "pritamdeka/BioBERT-mnli-snli-scinli-scitail-mednli-stsb",
+          "pritamdeka/PubMedBERT-mnli-snli-scinli-scitail-mednli-stsb"]
+
+KEY_SIZE = 16
+
+# 句子雜湊
+def sentence_key(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=KEY_SIZE).digest()
+
+# 中心性 - 與其他句子之餘弦相似度總和 / 最大值, O(n·d) (等同 cos_sim 矩陣之列總和 - 1)
+def centrality(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norm = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.maximum(norm, 1e-12)
+    cosine = embeddings @ embeddings.sum(0) - 1
+    return cosine / np.max(cosine)
+
+
+class EmbeddingCache:
+    '''
+    Append-only embedding store of one model
+    Every writer appends to its own segment (<segment>.keys / <segment>.f16),
+    all segments found in the folder are readable
+    '''
+    def __init__(self, path, segment=None):
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.dim = None
+        dim_file = os.path.join(path, 'dim')
+        if os.path.exists(dim_file):
+            with open(dim_file) as f:
+                self.dim = int(f.read())
+        self.segment = segment or str(os.getpid())
+        self.rows = {}          # key -> (segment, row)
+        self.counts = {}        # segment -> number of rows
+        self.arrays = {}        # segment -> memmap
+        if self.dim is not None:
+            for file in sorted(os.listdir(path)):
+                if file.endswith('.keys'):
+                    self._load(file[:-5])
+            # 截斷自身 segment 未完整寫入之尾端
+            if self.segment in self.counts:
+                n = self.counts[self.segment]
+                os.truncate(self._file(self.segment, '.keys'), n * KEY_SIZE)
+                os.truncate(self._file(self.segment, '.f16'), n * self.dim * 2)
+
+    def _file(self, segment, ext):
+        return os.path.join(self.path, segment + ext)
+
+    def _map(self, segment):
+        n = self.counts[segment]
+        self.arrays[segment] = np.memmap(self._file(segment, '.f16'), dtype=np.float16,
+                                         mode='r', shape=(n, self.dim)) if n else None
+
+    def _load(self, segment):
+        with open(self._file(segment, '.keys'), 'rb') as f:
+            keys = f.read()
+        vec_file = self._file(segment, '.f16')
+        n_vec = os.path.getsize(vec_file) // (2 * self.dim) if os.path.exists(vec_file) else 0
+        n = min(len(keys) // KEY_SIZE, n_vec)
+        for row in range(n):
+            self.rows[keys[row * KEY_SIZE:(row + 1) * KEY_SIZE]] = (segment, row)
+        self.counts[segment] = n
+        self._map(segment)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def get(self, keys):
+        out = np.empty((len(keys), self.dim), dtype=np.float32)
+        for i, key in enumerate(keys):
+            segment, row = self.rows[key]
+            out[i] = self.arrays[segment][row]
+        return out
+
+    def add(self, keys, vectors):
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with open(os.path.join(self.path, 'dim'), 'w') as f:
+                f.write(str(self.dim))
+        vectors = np.ascontiguousarray(vectors, dtype=np.float16)
+        with open(self._file(self.segment, '.f16'), 'ab') as f:
+            f.write(vectors.tobytes())
+        with open(self._file(self.segment, '.keys'), 'ab') as f:
+            f.write(b''.join(keys))
+        start = self.counts.get(self.segment, 0)
+        for i, key in enumerate(keys):
+            self.rows[key] = (self.segment, start + i)
+        self.counts[self.segment] = start + len(keys)
+        self._map(self.segment)
+
+
+class EmbeddingService:
+    '''
+    Args:
+        models(list): sentence-transformers model names
+        cache_dir(str): embedding cache folder (None: no disk cache)
+        batch_size(int): encoding batch size
+    '''
+    def __init__(self, models=MODELS, cache_dir=None, batch_size=256, device=None):
+        self.names = list(models)
+        self.cache_dir = cache_dir
+        self.batch_size = batch_size
+        self.device = device
+        self.models = {}
+        self.caches = {}
+        self.memory = {name: {} for name in self.names}
+
+    # 每個 process 只載入一次
+    def model(self, name):
+        if name not in self.models:
+            from sentence_transformers import SentenceTransformer
+            self.models[name] = SentenceTransformer(name, device=self.device)
+        return self.models[name]
+
+    def cache(self, name):
+        if self.cache_dir is None:
+            return None
+        if name not in self.caches:
+            self.caches[name] = EmbeddingCache(os.path.join(self.cache_dir, name.replace('/', '__')))
+        return self.caches[name]
+
+    # 編碼尚未快取之句子 (可跨文章一次送入大批次)
+    def prefetch(self, texts, name=None):
+        for name in ([name] if name else self.names):
+            cache, memory = self.cache(name), self.memory.setdefault(name, {})
+            missing = {}
+            for text in texts:
+                key = sentence_key(text)
+                if key not in memory and (cache is None or key not in cache):
+                    missing.setdefault(key, text)
+            if not missing:
+                continue
+            vectors = self.model(name).encode(list(missing.values()), batch_size=self.batch_size,
+                                              convert_to_numpy=True, normalize_embeddings=True)
+            if cache is not None:
+                cache.add(list(missing.keys()), vectors)
+            else:
+                memory.update(zip(missing.keys(), vectors.astype(np.float32)))
+
+    # 單位長度句向量 (n, d)
+    def encode(self, texts, name):
+        self.prefetch(texts, name)
+        keys = [sentence_key(text) for text in texts]
+        cache = self.cache(name)
+        if cache is not None:
+            return cache.get(keys)
+        return np.stack([self.memory[name][key] for key in keys])
+
+    # 清除記憶體中 (未使用磁碟快取時) 之向量
+    def clear(self):
+        for memory in self.memory.values():
+            memory.clear()
@@ -1,3 +1,10 @@
-from eval_utils.reader import read_pmcids, sent_json, convert_sentence_obj, convert_lead_sentence_obj
-from eval_utils.model import load_ExtModel, load_AbstrModel
-from eval_utils.trigram_blocking import TrigramBlock
\ No newline at end of file
+from eval_utils.reader import read_pmcids, sent_json, read_features, convert_sentence_obj, convert_lead_sentence_obj
+from eval_utils.corpus_store import CorpusStore, build_store
+from eval_utils.inference import predict_articles, select_sentences
+from eval_utils.model import load_ExtModel, load_ExtPredictor, ExtPredictor, load_AbstrModel, setup_cpu, quantize_dynamic
+from eval_utils.generation import generate_batched, generate_sections
+from eval_utils.generation_cache import GenerationCache
+from eval_utils.rouge import Rouge
+from eval_utils.pair_writer import PairWriter
+from eval_utils.sweep import sweep
+from eval_utils.trigram_blocking import TrigramBlock, TrigramBlocker
\ No newline at end of file
@@ -0,0 +1,245 @@
+"""
+Benchmarks of the evaluation tooling against the per-article loop of the notebooks
+(runs on the real test split, or on synthetic articles and a small LightGBM model)
+"""
+import os
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from eval_utils.reader import read_features
+from eval_utils.inference import predict_articles
+from eval_utils.model import ExtPredictor, quantize_dynamic
+from eval_utils.generation import generate_batched
+from eval_utils.trigram_blocking import TrigramBlock, TrigramBlocker
+
+
+def synthetic_articles(od, n_articles=500, seed=0):
+    """Random sentence features of `n_articles` articles written to `od`
+
+    Returns:
+        pmcids(list): ids of the written articles
+    """
+    rng = np.random.RandomState(seed)
+    pmcids = []
+    for i in range(n_articles):
+        n = rng.randint(20, 300)
+        df = pd.DataFrame({'section': np.sort(rng.randint(1, 5, n)).astype('int8'),
+                           **{'F%d' % j: rng.rand(n).astype('float32') for j in range(1, 11)},
+                           'label': rng.rand(n) < 0.1})
+        pmcids.append('PMC%d' % i)
+        df.to_parquet(os.path.join(od, pmcids[-1] + '.parquet'))
+    return pmcids
+
+
+def synthetic_model(block_cols, n_rows=20000, seed=0):
+    """LightGBM classifier fitted on random features"""
+    import lightgbm
+    rng = np.random.RandomState(seed)
+    x = pd.DataFrame({'section': rng.randint(1, 5, n_rows).astype('int8'),
+                      **{'F%d' % j: rng.rand(n_rows).astype('float32') for j in range(1, 11)}})
+    y = (x['F1'] + x['F2'] + rng.rand(n_rows) > 2.2).astype(int)
+    x = x.drop(columns=[c for c in block_cols if c in x.columns])
+    return lightgbm.LGBMClassifier(n_estimators=200, verbose=-1).fit(x, y)
+
+
+# 各篇分別預測 (ext_score.ipynb 之 process_article)
+def _loop_predict(model, pmcids, threshold, block_cols, parquet_dir):
+    for pmcid in pmcids:
+        df = read_features(f'{parquet_dir}/{pmcid}.parquet')
+        true_proba = model.predict_proba(df.drop(columns=block_cols))[:, 1]
+        if not np.any(true_proba > threshold):
+            true_proba[true_proba == np.max(true_proba)] = 1
+        pred = (true_proba > threshold).astype('int')
+        yield pmcid, pred, true_proba
+
+
+def benchmark_inference(model, pmcids, parquet_dir, threshold=0.5,
+                        block_cols=('F8', 'F9', 'label'), batch_size=1000):
+    """Compare the per-article loop and `predict_articles`
+
+    Prints articles/sec of both and checks that selections and probabilities are identical.
+    """
+    block_cols = list(block_cols)
+    results = {}
+    for name, fn in [('loop', _loop_predict),
+                     ('batched', lambda *args: predict_articles(*args, batch_size=batch_size))]:
+        t0 = time.time()
+        results[name] = list(fn(model, pmcids, threshold, block_cols, parquet_dir))
+        elapsed = time.time() - t0
+        print("%-8s %8.1f articles/sec  (%.2fs)" % (name, len(pmcids) / elapsed, elapsed))
+    same = all(a[0] == b[0] and np.array_equal(a[1], b[1]) and np.array_equal(a[2], b[2])
+               for a, b in zip(results['loop'], results['batched']))
+    print("same: %s" % same)
+    return same
+
+
+def benchmark_predictor(model, x, block_cols=('F8', 'F9', 'label'), n_threads=None,
+                        article_size=150, repeat=200, atol=1e-6):
+    """Compare the pickled estimator and `ExtPredictor`
+
+    Latency is the time of one article sized call (`article_size` rows),
+    throughput is rows/sec of one call on all of `x`.
+    Checks that probabilities match within `atol`.
+    """
+    lean = ExtPredictor(model, list(block_cols), n_threads)
+    x = x.drop(columns=[c for c in block_cols if c in x.columns])
+    article = x.iloc[:article_size]
+    arr, article_arr = lean.to_array(x), lean.to_array(article)
+    print("feature order: %s" % lean.feature_names)
+    for name, predict, batch, one in [('pickled', lambda v: model.predict_proba(v)[:, 1], x, article),
+                                      ('lean', lean.predict, arr, article_arr)]:
+        t0 = time.time()
+        for _ in range(repeat):
+            predict(one)
+        latency = (time.time() - t0) / repeat
+        t0 = time.time()
+        predict(batch)
+        throughput = len(batch) / (time.time() - t0)
+        print("%-8s latency: %8.3fms  throughput: %10.0f rows/sec" % (name, latency * 1000, throughput))
+    diff = np.max(np.abs(model.predict_proba(x)[:, 1] - lean.predict(arr))) if len(x) else 0.0
+    print("max abs diff: %.2e" % diff)
+    return diff <= atol
+
+
+def synthetic_bodies(words, n_articles=200, n_sents=150, seed=0):
+    """Body tables as convert_sentence_df (section, text, predict, proba) with repeated phrases"""
+    rng = np.random.RandomState(seed)
+    bodies = []
+    for _ in range(n_articles):
+        texts = [' '.join(rng.choice(words, rng.randint(3, 30))) for _ in range(n_sents)]
+        bodies.append(pd.DataFrame({'section': rng.choice(list('IMRD'), n_sents), 'text': texts,
+                                    'predict': rng.rand(n_sents) < 0.3,
+                                    'proba': rng.rand(n_sents).astype('float16')})
+                      .astype({'section': 'category', 'text': 'string'}))
+    return bodies
+
+
+# 逐句 TrigramBlock (ext_score.ipynb 之 convert_sentence_df)
+def _loop_blocking(body):
+    body = body.copy()
+    for section in 'IMRD':
+        block = TrigramBlock()
+        temp = body.loc[(body['section'] == section) & (body['predict'] == True)].sort_values(by='proba', ascending=False)
+        for i, row in temp.iterrows():
+            if block.check_overlap(row['text']):
+                body.at[i, 'predict'] = False
+    return body['predict'].to_numpy(dtype=bool)
+
+
+def benchmark_blocking(bodies):
+    """Compare the per-sentence `TrigramBlock` loop and `TrigramBlocker.block_article`
+
+    Prints articles/sec of both and checks that the kept sentences are identical.
+    """
+    blocker = TrigramBlocker()
+    results = {}
+    for name, fn in [('loop', _loop_blocking),
+                     ('hashed', lambda b: blocker.block_article(b['text'], b['proba'], b['section'], b['predict']))]:
+        t0 = time.time()
+        results[name] = [fn(body) for body in bodies]
+        elapsed = time.time() - t0
+        print("%-8s %8.1f articles/sec  (%.2fs)" % (name, len(bodies) / elapsed, elapsed))
+    same = all(np.array_equal(a, b) for a, b in zip(results['loop'], results['hashed']))
+    print("same: %s" % same)
+    return same
+
+
+def tiny_seq2seq(vocab_size=100, seed=0):
+    """Randomly initialized tiny BART and a whitespace word-level tokenizer (w0, w1, ...)
+
+    Returns:
+        tokenizer, model, words
+    """
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors
+    from transformers import PreTrainedTokenizerFast, BartConfig, BartForConditionalGeneration
+    words = ['w%d' % i for i in range(vocab_size - 4)]
+    vocab = dict({'<s>': 0, '<pad>': 1, '</s>': 2, '<unk>': 3}, **{w: i + 4 for i, w in enumerate(words)})
+    tk = Tokenizer(models.WordLevel(vocab, unk_token='<unk>'))
+    tk.pre_tokenizer = pre_tokenizers.Whitespace()
+    tk.post_processor = processors.TemplateProcessing(single='<s> $A </s>', special_tokens=[('<s>', 0), ('</s>', 2)])
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tk, bos_token='<s>', eos_token='</s>',
+                                        pad_token='<pad>', unk_token='<unk>', model_max_length=120)
+    torch.manual_seed(seed)
+    config = BartConfig(vocab_size=vocab_size, d_model=32, encoder_layers=2, decoder_layers=2,
+                        encoder_attention_heads=2, decoder_attention_heads=2, encoder_ffn_dim=64,
+                        decoder_ffn_dim=64, max_position_embeddings=128, pad_token_id=1, bos_token_id=0,
+                        eos_token_id=2, decoder_start_token_id=2, forced_bos_token_id=None)
+    model = BartForConditionalGeneration(config).eval()
+    model.generation_config.max_length = 32
+    return tokenizer, model, words
+
+
+def synthetic_texts(words, n_texts=200, max_words=110, seed=0):
+    """Random inputs of varying length"""
+    rng = np.random.RandomState(seed)
+    return [' '.join(rng.choice(words, rng.randint(0, max_words))) for _ in range(n_texts)]
+
+
+def benchmark_generation(texts, tokenizer, model, max_tokens=16384, **kwargs):
+    """Compare per-item generation (batch size 1) and `generate_batched`
+
+    Prints items/sec of both and checks that outputs are identical.
+    """
+    import torch
+    t0 = time.time()
+    ref = []
+    for text in texts:
+        inputs = tokenizer(text, truncation=True, return_tensors='pt').input_ids
+        with torch.no_grad():
+            ref.append(tokenizer.decode(model.generate(inputs.to(model.device), **kwargs)[0], skip_special_tokens=True))
+    t_ref = time.time() - t0
+    t0 = time.time()
+    out = generate_batched(texts, tokenizer, model, max_tokens=max_tokens, **kwargs)
+    t_new = time.time() - t0
+    same = sum(a == b for a, b in zip(ref, out))
+    print("per-item: %8.1f items/sec  batched: %8.1f items/sec  same: %d/%d"
+          % (len(texts) / t_ref, len(texts) / t_new, same, len(texts)))
+    return same == len(texts)
+
+
+def _rouge(hyps, refs):
+    from rouge_score import rouge_scorer
+    scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
+    scores = [scorer.score(ref, hyp) for hyp, ref in zip(hyps, refs)]
+    return {key: np.mean([score[key].fmeasure for score in scores]) for key in ['rouge1', 'rouge2', 'rougeL']}
+
+
+def benchmark_quantization(texts, tokenizer, model, references=None, n_threads=None, max_tokens=16384, **kwargs):
+    """Compare the fp32 model and its int8 dynamic quantization on CPU
+
+    Prints generated tokens/sec of both, the ROUGE of the int8 outputs against the fp32 outputs,
+    and (given `references`) the ROUGE drift against the references.
+    """
+    import torch
+    if n_threads:
+        torch.set_num_threads(n_threads)
+    model = model.to('cpu').eval()
+    outputs = {}
+    for name, m in [('fp32', model), ('int8', quantize_dynamic(model))]:
+        t0 = time.time()
+        outputs[name] = generate_batched(texts, tokenizer, m, max_tokens=max_tokens, **kwargs)
+        elapsed = time.time() - t0
+        n_tokens = sum(len(ids) for ids in tokenizer(outputs[name], add_special_tokens=False)['input_ids'])
+        print("%-5s %10.1f tokens/sec  (%.2fs)" % (name, n_tokens / elapsed, elapsed))
+    agreement = _rouge(outputs['int8'], outputs['fp32'])
+    print("int8 vs fp32: %s" % ', '.join('%s %.4f' % item for item in agreement.items()))
+    if references is not None:
+        fp32, int8 = _rouge(outputs['fp32'], references), _rouge(outputs['int8'], references)
+        print("drift: %s" % ', '.join('%s %+.4f' % (key, int8[key] - fp32[key]) for key in fp32))
+    return agreement
+
+
+if __name__ == '__main__':
+    block = ['F8', 'F9', 'label']
+    with tempfile.TemporaryDirectory() as tmp:
+        ids = synthetic_articles(tmp)
+        model = synthetic_model(block)
+        benchmark_inference(model, ids, tmp, threshold=0.5, block_cols=block)
+        x = pd.concat([read_features(f'{tmp}/{pmcid}.parquet') for pmcid in ids], ignore_index=True)
+        benchmark_predictor(model, x, block_cols=block, n_threads=1)
+    tokenizer, model, words = tiny_seq2seq()
+    benchmark_blocking(synthetic_bodies(words))
+    benchmark_generation(synthetic_texts(words), tokenizer, model, max_tokens=4096)
+    benchmark_quantization(synthetic_texts(words), tokenizer, model, references=synthetic_texts(words, seed=1), min_length=16)
@@ -0,0 +1,162 @@
+'''
+Columnar corpus store of one split (e.g. test)
+Sentence text, position, label and sentence features (F1-F10) of all articles
+are packed into uncompressed Arrow IPC files, which are memory-mapped on open:
+an article is a zero-copy slice located through the pmcid index,
+a split can be scanned sequentially without opening one file per article
+'''
+
+import os
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+INDEX_FILE = 'index.arrow'
+SECTIONS = 'IMRD'
+
+INDEX_SCHEMA = pa.schema([('pmcid', pa.string()), ('title', pa.string()),
+                          ('body_offset', pa.int64()), ('body_length', pa.int64()),
+                          ('abstract_offset', pa.int64()), ('abstract_length', pa.int64())])
+BODY_SCHEMA = pa.schema([('section', pa.string()), ('text', pa.string()), ('tokenize_text', pa.string()),
+                         ('pos', pa.int32()), ('pos_para', pa.int32()), ('label', pa.int8())])
+ABSTRACT_SCHEMA = pa.schema([('section', pa.string()), ('text', pa.string()), ('tokenize_text', pa.string()),
+                             ('pos', pa.int32())])
+
+# 是否為 corpus store 目錄
+def is_store(path):
+    return os.path.isfile(os.path.join(path, INDEX_FILE))
+
+# 句子物件 -> 列 (缺少之欄位為 null)
+def _rows(sents, schema):
+    names = schema.names[1:]
+    return [dict({'section': key}, **{name: sent.get(name) for name in names})
+            for key in SECTIONS for sent in sents.get(key, [])]
+
+# 建立 corpus store (依 pmcid_file 之順序, 每 batch_size 篇寫入一次)
+def build_store(pmcid_file, json_dir, od, parquet_dir=None, batch_size=500):
+    '''
+    Args:
+        pmcid_file(str): train/test pmcids
+        json_dir(str): sentence json folder
+        od(str): output folder
+        parquet_dir(str): sentence features folder (None: store without features)
+    '''
+    if not os.path.exists(od):
+        os.makedirs(od)
+    with open(pmcid_file) as f:
+        pmcids = [line.rstrip('\n') for line in f if line.strip()]
+
+    writers, index = {}, {name: [] for name in INDEX_SCHEMA.names}
+    offsets = {'body': 0, 'abstract': 0}
+
+    def write(name, table):
+        if name not in writers:
+            writers[name] = pa.ipc.new_file(os.path.join(od, name + '.arrow'), table.schema)
+        writers[name].write_table(table)
+
+    try:
+        for start in range(0, len(pmcids), batch_size):
+            rows = {'body': [], 'abstract': []}
+            features = []
+            for pmcid in pmcids[start:start+batch_size]:
+                with open(os.path.join(json_dir, pmcid + '.json')) as f:
+                    sentJson = json.load(f)
+                index['pmcid'].append(pmcid)
+                index['title'].append(sentJson.get('title'))
+                for part, schema in [('body', BODY_SCHEMA), ('abstract', ABSTRACT_SCHEMA)]:
+                    part_rows = _rows(sentJson[part], schema)
+                    rows[part].extend(part_rows)
+                    index[part + '_offset'].append(offsets[part])
+                    index[part + '_length'].append(len(part_rows))
+                    offsets[part] += len(part_rows)
+                if parquet_dir is not None:
+                    table = pq.read_table(os.path.join(parquet_dir, pmcid + '.parquet')).replace_schema_metadata(None)
+                    if table.num_rows != index['body_length'][-1]:
+                        raise ValueError('%s: %d feature rows for %d body sentences'
+                                         % (pmcid, table.num_rows, index['body_length'][-1]))
+                    features.append(table)
+            write('body', pa.Table.from_pylist(rows['body'], schema=BODY_SCHEMA))
+            write('abstract', pa.Table.from_pylist(rows['abstract'], schema=ABSTRACT_SCHEMA))
+            if features:
+                write('features', pa.concat_tables(features))
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    # 索引最後寫入, 存在即代表 store 完整
+    tmp = os.path.join(od, INDEX_FILE + '.part')
+    with pa.ipc.new_file(tmp, INDEX_SCHEMA) as writer:
+        writer.write_table(pa.Table.from_pydict(index, schema=INDEX_SCHEMA))
+    os.replace(tmp, os.path.join(od, INDEX_FILE))
+
+
+class CorpusStore:
+    '''
+    Args:
+        path(str): corpus store folder (build_store output)
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.index = self._read(INDEX_FILE)
+        self.body = self._read('body.arrow')
+        self.abstract = self._read('abstract.arrow')
+        self.features = self._read('features.arrow') if os.path.exists(os.path.join(path, 'features.arrow')) else None
+        self.pmcids = self.index.column('pmcid').to_pylist()
+        self.rows = {pmcid: i for i, pmcid in enumerate(self.pmcids)}
+        self.offsets = {name: self.index.column(name).to_numpy()
+                        for name in ['body_offset', 'body_length', 'abstract_offset', 'abstract_length']}
+
+    # memory-mapped, zero-copy
+    def _read(self, name):
+        return pa.ipc.open_file(pa.memory_map(os.path.join(self.path, name))).read_all()
+
+    def __len__(self):
+        return len(self.pmcids)
+
+    def __contains__(self, pmcid):
+        return pmcid in self.rows
+
+    def _slice(self, table, part, row):
+        return table.slice(self.offsets[part + '_offset'][row], self.offsets[part + '_length'][row])
+
+    # 單篇文章之 body / abstract / features (zero-copy slice)
+    def article(self, pmcid):
+        row = self.rows[pmcid]
+        features = None if self.features is None else self._slice(self.features, 'body', row)
+        return self._slice(self.body, 'body', row), self._slice(self.abstract, 'abstract', row), features
+
+    # 句子特徵 (與 sentence_features/{pmcid}.parquet 相同)
+    def read_features(self, pmcid):
+        if self.features is None:
+            raise KeyError('%s has no sentence features' % self.path)
+        return self.article(pmcid)[2].to_pandas()
+
+    # 還原 sentence json
+    def sent_json(self, pmcid):
+        body, abstract, _ = self.article(pmcid)
+        sentJson = {'title': self.index.column('title')[self.rows[pmcid]].as_py()}
+        for part, table in [('abstract', abstract), ('body', body)]:
+            cols = table.to_pydict()
+            names = [name for name in table.column_names if name != 'section']
+            sents = {key: [] for key in SECTIONS}
+            for i, key in enumerate(cols['section']):
+                sents[key].append({name: cols[name][i] for name in names if cols[name][i] is not None})
+            sentJson[part] = sents
+        return sentJson
+
+    # 依序讀取: (pmcid, body, abstract, features)
+    def scan(self, pmcids=None):
+        for pmcid in (self.pmcids if pmcids is None else pmcids):
+            yield (pmcid,) + self.article(pmcid)
+
+
+
+if __name__ == '__main__':
+
+    pmcid_file = '../../dataset/pmcids/test.txt'
+    json_dir = '../../dataset/sentence_json/'
+    parquet_dir = '../../dataset/sentence_features/'
+    output_dir = '../../dataset/corpus_store/test/'
+
+    # build_store(pmcid_file, json_dir, output_dir, parquet_dir)
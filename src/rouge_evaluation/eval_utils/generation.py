@@ -0,0 +1,71 @@
+import torch
+
+
+# 依長度排序並切分批次 (每批 最長輸入長度 x 句數 x beams 不超過 max_tokens)
+def length_buckets(lengths, max_tokens, max_batch_size=64, num_beams=1):
+    '''
+    Args:
+        lengths(list of int): token length of each input
+        max_tokens(int): token budget of a batch (padded input tokens x num_beams)
+    Returns:
+        batches(list of list): input indices of each batch, longest inputs first
+    '''
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    batches, batch = [], []
+    for i in order:
+        # 已排序, 批次第一筆即為最長輸入
+        width = lengths[batch[0]] if batch else lengths[i]
+        if batch and (len(batch) >= max_batch_size or (len(batch) + 1) * width * num_beams > max_tokens):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+# 批次生成, 回傳與 texts 相同順序之輸出
+def generate_batched(texts, tokenizer, model, max_tokens=16384, max_batch_size=64, device=None, cache=None, **kwargs):
+    '''
+    Args:
+        texts(list of str): model inputs
+        tokenizer, model: seq2seq tokenizer and model (e.g. load_AbstrModel)
+        max_tokens(int): token budget of a batch
+        cache(GenerationCache): only inputs not generated before (same checkpoint and config) are generated
+        kwargs: generation arguments (default: model.generation_config)
+    Returns:
+        outputs(list of str): decoded outputs in the order of texts
+    '''
+    if cache is not None:
+        keys = cache.keys(texts, model, tokenizer, **kwargs)
+        found = cache.get(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        generated = generate_batched(list(missing.values()), tokenizer, model, max_tokens, max_batch_size, device, **kwargs)
+        generated = dict(zip(missing.keys(), generated))
+        cache.put(generated)
+        found.update(generated)
+        return [found[key] for key in keys]
+    if not texts:
+        return []
+    device = device or model.device
+    input_ids = tokenizer(list(texts), truncation=True)['input_ids']
+    num_beams = kwargs.get('num_beams') or getattr(model.generation_config, 'num_beams', 1) or 1
+    outputs = [None] * len(texts)
+    for batch in length_buckets([len(ids) for ids in input_ids], max_tokens, max_batch_size, num_beams):
+        inputs = tokenizer.pad({'input_ids': [input_ids[i] for i in batch]}, return_tensors='pt').to(device)
+        with torch.no_grad():
+            generated = model.generate(**inputs, **kwargs)
+        for i, text in zip(batch, tokenizer.batch_decode(generated, skip_special_tokens=True)):
+            outputs[i] = text
+    return outputs
+
+# 多篇文章之 IMRD 各章節生成 (等同逐篇逐章節呼叫 abstr_score.ipynb 之 generate)
+def generate_sections(exts, tokenizer, model, **kwargs):
+    '''
+    Args:
+        exts(list of DataFrame): extracted sentences of each article (columns: section, text)
+    Returns:
+        abstrs(list of dict): generated text of each section of each article
+    '''
+    texts = [' '.join(list(ext[ext['section']==section]['text'])) for ext in exts for section in 'IMRD']
+    outputs = generate_batched(texts, tokenizer, model, **kwargs)
+    return [dict(zip('IMRD', outputs[i:i+4])) for i in range(0, len(outputs), 4)]
@@ -0,0 +1,100 @@
+'''
+Persistent cache of generated summaries (SQLite key-value file)
+key = hash(checkpoint identity, generation config, input text),
+least recently used entries are evicted when the file exceeds max_bytes
+'''
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+
+# 模型識別 - 名稱/路徑, 本地 checkpoint 之設定檔及權重檔 (大小, 修改時間), 是否量化
+def checkpoint_id(model):
+    path = getattr(model, 'name_or_path', '') or getattr(model.config, '_name_or_path', '')
+    files = []
+    if os.path.isdir(path):
+        for file in sorted(os.listdir(path)):
+            if file.endswith(('.json', '.bin', '.safetensors')):
+                stat = os.stat(os.path.join(path, file))
+                files.append((file, stat.st_size, int(stat.st_mtime)))
+    quantized = any('quantized' in type(m).__module__ for m in model.modules())
+    return json.dumps([type(model).__name__, path, files, str(model.dtype), quantized])
+
+# 生成設定 (model.generation_config + generate() 參數)
+def generation_id(model, tokenizer, **kwargs):
+    config = model.generation_config.to_dict()
+    config.pop('transformers_version', None)
+    config.update(kwargs)
+    config['model_max_length'] = tokenizer.model_max_length
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+class GenerationCache:
+    '''
+    Args:
+        path(str): cache file
+        max_bytes(int): size bound of the cached outputs, least recently used are evicted
+    '''
+    def __init__(self, path, max_bytes=1 << 30):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                          '(key TEXT PRIMARY KEY, value TEXT, size INTEGER, used REAL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS cache_used ON cache (used)')
+        self.conn.commit()
+
+    # 由模型、生成設定及輸入文字組成 key
+    @staticmethod
+    def keys(texts, model, tokenizer, **kwargs):
+        prefix = hashlib.sha256((checkpoint_id(model) + generation_id(model, tokenizer, **kwargs)).encode('utf-8')).hexdigest()
+        return [hashlib.sha256((prefix + text).encode('utf-8')).hexdigest() for text in texts]
+
+    # 回傳 {key: value} (僅包含已快取者)
+    def get(self, keys):
+        found = {}
+        keys = list(set(keys))
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start+500]
+            rows = self.conn.execute('SELECT key, value FROM cache WHERE key IN (%s)' % ','.join('?' * len(batch)), batch)
+            found.update(rows.fetchall())
+        if found:
+            now = time.time()
+            self.conn.executemany('UPDATE cache SET used=? WHERE key=?', [(now, key) for key in found])
+            self.conn.commit()
+        return found
+
+    def put(self, items):
+        now = time.time()
+        self.conn.executemany('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                              [(key, value, len(value.encode('utf-8')), now) for key, value in items.items()])
+        self.conn.commit()
+        self.evict()
+
+    def size(self):
+        return self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+
+    # 超過 max_bytes 時刪除最久未使用者
+    def evict(self):
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return
+        removed, keys = 0, []
+        for key, size in self.conn.execute('SELECT key, size FROM cache ORDER BY used'):
+            keys.append(key)
+            removed += size
+            if removed >= excess:
+                break
+        self.conn.executemany('DELETE FROM cache WHERE key=?', [(key,) for key in keys])
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from eval_utils.reader import read_features
+
+
+# 閾值選句 (向量化, 以文章 offsets 分段)
+def select_sentences(true_proba, lengths, threshold):
+    '''
+    Args:
+        true_proba(np.array): probabilities of all sentences of the batch (modified in place)
+        lengths(list of int): number of sentences of each article
+        threshold(float): decision threshold
+    Returns:
+        pred(np.array): 0/1 prediction of every sentence
+        true_proba(np.array): probabilities, the max of an article without any sentence
+                              above the threshold is set to 1
+    '''
+    lengths = np.asarray(lengths, dtype=np.int64)
+    nonempty = lengths > 0
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])[nonempty]
+    seg = np.repeat(np.arange(nonempty.sum()), lengths[nonempty])
+    over = true_proba > threshold
+    # 如果文章沒有任何句子的預測機率大於閾值，則選取最大機率的句子為摘要句
+    none_over = ~np.logical_or.reduceat(over, starts) if len(starts) else np.zeros(0, dtype=bool)
+    seg_max = np.maximum.reduceat(true_proba, starts) if len(starts) else np.zeros(0)
+    true_proba[none_over[seg] & (true_proba == seg_max[seg])] = 1
+    pred = (true_proba > threshold).astype('int')
+    return pred, true_proba
+
+# 多篇文章一次預測機率 (未套用閾值), 每批回傳 (pmcids, lengths, true_proba)
+def predict_proba_batches(model, pmcids, block_cols, parquet_dir, batch_size=1000):
+    for start in range(0, len(pmcids), batch_size):
+        batch = pmcids[start:start+batch_size]
+        dfs = [read_features(f'{parquet_dir}/{pmcid}.parquet') for pmcid in batch]
+        lengths = [len(df) for df in dfs]
+        x = pd.concat(dfs, ignore_index=True).drop(columns=block_cols)
+        true_proba = model.predict_proba(x)[:, 1] if len(x) else np.zeros(0)
+        yield batch, lengths, true_proba
+
+# 多篇文章一次預測, 回傳每篇之 (pmcid, pred, true_proba)
+def predict_articles(model, pmcids, threshold, block_cols, parquet_dir, batch_size=1000):
+    '''
+    Args:
+        model: classifier with predict_proba
+        pmcids(list): articles to predict (output keeps this order)
+        block_cols(list): feature columns dropped before prediction
+        parquet_dir(str): sentence features folder or corpus store
+        batch_size(int): number of articles per predict_proba call
+    '''
+    for batch, lengths, true_proba in predict_proba_batches(model, pmcids, block_cols, parquet_dir, batch_size):
+        pred, true_proba = select_sentences(true_proba, lengths, threshold)
+        offset = 0
+        for pmcid, n in zip(batch, lengths):
+            yield pmcid, pred[offset:offset+n], true_proba[offset:offset+n]
+            offset += n
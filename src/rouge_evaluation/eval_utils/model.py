@@ -1,13 +1,106 @@
+import os
 import pickle
+import warnings
+import numpy as np
 import pandas as pd
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 
+FEATURES = ['section', 'F1', 'F2', 'F3', 'F4', 'F5', 'F6', 'F7', 'F8', 'F9', 'F10']
+
 # extractive summarizer
 def load_ExtModel(path):
     return pickle.load(open(path, 'rb'))
 
+# extractive summarizer - 精簡預測器 (native booster, 固定執行緒數, 輸入 float32 array)
+def load_ExtPredictor(path, block_cols=None, n_threads=None):
+    return ExtPredictor(load_ExtModel(path), block_cols, n_threads)
+
+
+class ExtPredictor:
+    '''
+    Args:
+        model: fitted LGBMClassifier / XGBClassifier / sklearn classifier
+        block_cols(list): columns dropped before prediction (e.g. BLOCK), used when the model has no feature names
+        n_threads(int): number of prediction threads (None: library default)
+    Attributes:
+        feature_names(list): expected column order of the input array
+    '''
+    def __init__(self, model, block_cols=None, n_threads=None):
+        self.model = model
+        self.n_threads = n_threads
+        names = getattr(model, 'feature_names_in_', None)
+        if hasattr(model, 'booster_'):                                  # LightGBM
+            self.kind = 'lightgbm'
+            self.booster = model.booster_
+            names = self.booster.feature_name()
+        elif hasattr(model, 'get_booster'):                             # XGBoost
+            self.kind = 'xgboost'
+            self.booster = model.get_booster()
+            names = self.booster.feature_names or names
+            if n_threads:
+                self.booster.set_param({'nthread': n_threads})
+        else:                                                           # sklearn (e.g. RF)
+            self.kind = 'sklearn'
+            self.booster = None
+            if n_threads and hasattr(model, 'n_jobs'):
+                model.n_jobs = n_threads
+        if names is None:
+            names = [c for c in FEATURES if c not in (block_cols or [])]
+        self.feature_names = list(names)
+
+    # DataFrame -> 依 feature_names 排列之連續 float32 array
+    def to_array(self, x):
+        if isinstance(x, pd.DataFrame):
+            x = x[self.feature_names].to_numpy(dtype=np.float32)
+        return np.ascontiguousarray(x, dtype=np.float32)
+
+    # 正類機率 (n,)
+    def predict(self, x):
+        x = self.to_array(x)
+        if self.kind == 'lightgbm':
+            kwargs = {'num_threads': self.n_threads} if self.n_threads else {}
+            return self.booster.predict(x, **kwargs)
+        if self.kind == 'xgboost':
+            return self.booster.inplace_predict(x)
+        with warnings.catch_warnings():                                 # fitted with feature names
+            warnings.simplefilter('ignore', UserWarning)
+            return self.model.predict_proba(x)[:, 1]
+
+    # 與 sklearn 相同之 (n, 2) 輸出, 可取代 load_ExtModel 之模型
+    def predict_proba(self, x):
+        true_proba = self.predict(x)
+        return np.stack([1 - true_proba, true_proba], axis=1)
+
+# CPU 推論設定 - 執行緒數 / 綁定 CPU 核心
+def setup_cpu(n_threads=None, cpus=None):
+    '''
+    Args:
+        n_threads(int): intra-op threads (None: torch default), set through torch.set_num_threads;
+                        OMP_NUM_THREADS is only read when torch is imported, export it before starting Python instead
+        cpus(list of int): CPU cores this process is pinned to (None: no affinity)
+    '''
+    import torch
+    if cpus is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+        n_threads = n_threads or len(cpus)
+    if n_threads:
+        torch.set_num_threads(n_threads)
+
+# int8 dynamic quantization (nn.Linear 權重轉 int8, 激活值於推論時量化)
+def quantize_dynamic(model):
+    import torch
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
 # abstractive summarizer
-def load_AbstrModel(path):
+# cpu=True: CPU 推論模式 (eval, 可選 int8 dynamic quantization, 執行緒數及 CPU 核心綁定)
+def load_AbstrModel(path, cpu=False, quantize=False, n_threads=None, cpus=None):
     tokenizer = AutoTokenizer.from_pretrained(path, trust_remote_code=True)
     model = AutoModelForSeq2SeqLM.from_pretrained(path, trust_remote_code=True, pass_global_tokens_to_decoder=True)
+    if cpu:
+        setup_cpu(n_threads, cpus)
+        model = model.to('cpu').eval()
+        if quantize:
+            model = quantize_dynamic(model)
     return tokenizer, model
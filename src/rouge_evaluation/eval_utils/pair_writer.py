@@ -0,0 +1,94 @@
+'''
+Streaming writer of extract / abstract pairs (training data of the abstractive model)
+Every batch is written once as a numbered Parquet shard of the output folder,
+a checkpoint records the written articles so an interrupted export resumes after the last shard.
+The folder is read as one table by pd.read_parquet (files starting with '_' or '.' are ignored)
+'''
+
+import os
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+CHECKPOINT_FILE = '_checkpoint.json'
+PAIR_SCHEMA = pa.schema([('pmcid', pa.string()), ('section', pa.string()),
+                         ('extract', pa.string()), ('abstract', pa.string())])
+
+
+class PairWriter:
+    '''
+    Args:
+        od(str): output folder (e.g. train_pair.parquet)
+        batch_size(int): number of articles per shard
+    '''
+    def __init__(self, od, batch_size=5000):
+        if os.path.isfile(od):
+            raise ValueError('%s is a single parquet file, expected a folder of shards' % od)
+        os.makedirs(od, exist_ok=True)
+        self.od, self.batch_size = od, batch_size
+        self.checkpoint = {'articles': 0, 'shards': 0, 'last': None}
+        path = os.path.join(od, CHECKPOINT_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.checkpoint = json.load(f)
+        # 檢查點之後寫入之 shard (中斷於更新檢查點前) 重新輸出
+        for file in os.listdir(od):
+            if file.startswith('part-') and self._shard_number(file) >= self.checkpoint['shards']:
+                os.remove(os.path.join(od, file))
+        self._reset()
+
+    def __enter__(self):
+        return self
+
+    # 中斷時亦輸出已完成之文章
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _shard_number(file):
+        return int(file[len('part-'):].split('.')[0])
+
+    def _reset(self):
+        self.columns = {name: [] for name in PAIR_SCHEMA.names}
+        self.pmcids = []
+
+    # 已輸出之文章數
+    @property
+    def done(self):
+        return self.checkpoint['articles']
+
+    # 尚未輸出之文章 (檢查 pmcid 順序與先前相同)
+    def remaining(self, pmcids):
+        if self.done and (len(pmcids) < self.done or pmcids[self.done - 1] != self.checkpoint['last']):
+            raise ValueError('%s was written from a different pmcid list' % self.od)
+        return pmcids[self.done:]
+
+    # 一篇文章之句子對, pairs: section -> (extract, abstract)
+    def write(self, pmcid, pairs):
+        for section, (extract, abstract) in pairs.items():
+            for name, value in zip(PAIR_SCHEMA.names, (pmcid, section, extract, abstract)):
+                self.columns[name].append(value)
+        self.pmcids.append(pmcid)
+        if len(self.pmcids) >= self.batch_size:
+            self.flush()
+
+    # 輸出目前批次為新的 shard, 再更新檢查點
+    def flush(self):
+        if not self.pmcids:
+            return
+        name = 'part-%05d.parquet' % self.checkpoint['shards']
+        tmp = os.path.join(self.od, '.' + name)
+        pq.write_table(pa.Table.from_pydict(self.columns, schema=PAIR_SCHEMA), tmp)
+        os.replace(tmp, os.path.join(self.od, name))
+        self.checkpoint = {'articles': self.done + len(self.pmcids), 'shards': self.checkpoint['shards'] + 1,
+                           'last': self.pmcids[-1]}
+        tmp = os.path.join(self.od, '.' + CHECKPOINT_FILE)
+        with open(tmp, 'w') as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp, os.path.join(self.od, CHECKPOINT_FILE))
+        print('%d articles' % self.done)
+        self._reset()
+
+    def close(self):
+        self.flush()
@@ -1,19 +1,48 @@
+import os
 import json
+import pandas as pd
+from functools import lru_cache
+from eval_utils.corpus_store import CorpusStore, is_store
 
 
-# get train/test - pmcids
+# open corpus store once per folder
+@lru_cache(maxsize=None)
+def open_store(path):
+    return CorpusStore(path)
+
+# {dir}/{pmcid}.{ext} -> (store, pmcid) if dir is a corpus store
+def _from_store(path):
+    folder, file = os.path.split(path)
+    folder = os.path.normpath(folder)
+    if is_store(folder):
+        return open_store(folder), os.path.splitext(file)[0]
+    return None, None
+
+# get train/test - pmcids (or all pmcids of a corpus store)
 def read_pmcids(path):
+    if os.path.isdir(path) and is_store(path):
+        return list(open_store(os.path.normpath(path)).pmcids)
     file = open(path)
     pmcids = [line.rstrip('\n') for line in file]
     file.close()
     return pmcids
 
-# get paper's sentJson 
+# get paper's sentJson (json file or corpus store)
 def sent_json(path):
+    store, pmcid = _from_store(path)
+    if store is not None:
+        return store.sent_json(pmcid)
     with open(path) as f:
         sentJson = json.load(f)
     return sentJson
 
+# get paper's sentence features (parquet file or corpus store)
+def read_features(path):
+    store, pmcid = _from_store(path)
+    if store is not None:
+        return store.read_features(pmcid)
+    return pd.read_parquet(path)
+
 # Convert sentence objects
 def convert_sentence_obj(sents, section='IMRD', label=False):
     '''
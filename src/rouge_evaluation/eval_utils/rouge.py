@@ -0,0 +1,187 @@
+'''
+Offline ROUGE-1/2/L/Lsum on integer token ids (same tokenization and scores as rouge_score)
+Words are mapped to ids once, Porter stems are cached per vocabulary word,
+ROUGE-L uses a bit-parallel LCS, batches can be scored across processes
+'''
+
+import re
+import multiprocessing
+from collections import Counter
+import numpy as np
+
+
+NON_ALPHANUM_RE = re.compile(r'[^a-z0-9]+')
+ROUGE_TYPES = ('rouge1', 'rouge2', 'rougeL', 'rougeLsum')
+
+
+def fmeasure(precision, recall):
+    return 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+
+
+class Vocabulary:
+    '''
+    word -> id, stemmed as rouge_score (Porter stemmer, words longer than 3 characters)
+    '''
+    def __init__(self, use_stemmer=True):
+        self.ids = {}
+        self.stems = {}
+        self.stemmer = None
+        if use_stemmer:
+            from nltk.stem import porter
+            self.stemmer = porter.PorterStemmer()
+
+    # 詞 -> id (詞幹快取)
+    def word_id(self, word):
+        token = self.stems.get(word)
+        if token is None:
+            token = self.stemmer.stem(word) if self.stemmer and len(word) > 3 else word
+            self.stems[word] = token
+        return self.ids.setdefault(token, len(self.ids))
+
+    def encode(self, text):
+        return [self.word_id(word) for word in NON_ALPHANUM_RE.sub(' ', text.lower()).split()]
+
+
+# n-gram 計數 (整數 id 編碼)
+def ngram_counts(ids, n):
+    if len(ids) < n:
+        return Counter()
+    if n == 1:
+        return Counter(ids)
+    return Counter(zip(*[ids[i:] for i in range(n)]))
+
+def score_ngrams(ref_ids, hyp_ids, n):
+    ref, hyp = ngram_counts(ref_ids, n), ngram_counts(hyp_ids, n)
+    overlap = sum((ref & hyp).values())
+    precision = overlap / max(sum(hyp.values()), 1)
+    recall = overlap / max(sum(ref.values()), 1)
+    return precision, recall, fmeasure(precision, recall)
+
+# LCS 長度 (bit-parallel, 每個 hyp token 以整數位元運算更新整列)
+def lcs_length(ref_ids, hyp_ids):
+    masks = {}
+    for i, token in enumerate(ref_ids):
+        masks[token] = masks.get(token, 0) | (1 << i)
+    full = (1 << len(ref_ids)) - 1
+    v = full
+    for token in hyp_ids:
+        u = v & masks.get(token, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(ref_ids) - bin(v).count('1')
+
+def score_lcs(ref_ids, hyp_ids):
+    if not ref_ids or not hyp_ids:
+        return 0, 0, 0
+    lcs = lcs_length(ref_ids, hyp_ids)
+    precision, recall = lcs / len(hyp_ids), lcs / len(ref_ids)
+    return precision, recall, fmeasure(precision, recall)
+
+# LCS 之 ref 索引 (與 rouge_score 回溯相同之選擇)
+def lcs_indices(ref, can):
+    rows, cols = len(ref), len(can)
+    table = [[0] * (cols + 1) for _ in range(rows + 1)]
+    for i in range(1, rows + 1):
+        prev, cur, r = table[i - 1], table[i], ref[i - 1]
+        for j in range(1, cols + 1):
+            cur[j] = prev[j - 1] + 1 if r == can[j - 1] else (prev[j] if prev[j] > cur[j - 1] else cur[j - 1])
+    i, j, lcs = rows, cols, []
+    while i > 0 and j > 0:
+        if ref[i - 1] == can[j - 1]:
+            lcs.append(i - 1)
+            i -= 1
+            j -= 1
+        elif table[i][j - 1] > table[i - 1][j]:
+            j -= 1
+        else:
+            i -= 1
+    return lcs
+
+# summary-level LCS (rougeLsum, 句子以換行分隔)
+def score_lcs_summary(ref_sents, hyp_sents):
+    m, n = sum(map(len, ref_sents)), sum(map(len, hyp_sents))
+    if not ref_sents or not hyp_sents or not m or not n:
+        return 0, 0, 0
+    cnt_r, cnt_c = Counter(), Counter()
+    for s in ref_sents:
+        cnt_r.update(s)
+    for s in hyp_sents:
+        cnt_c.update(s)
+    hits = 0
+    for r in ref_sents:
+        union = sorted(set().union(*[lcs_indices(r, c) for c in hyp_sents]))
+        for t in (r[i] for i in union):
+            if cnt_c[t] > 0 and cnt_r[t] > 0:
+                hits += 1
+                cnt_c[t] -= 1
+                cnt_r[t] -= 1
+    precision, recall = hits / n, hits / m
+    return precision, recall, fmeasure(precision, recall)
+
+
+class Rouge:
+    '''
+    Drop-in for evaluate.load('rouge').compute (fmeasure; aggregated as the mean over pairs)
+
+    Args:
+        rouge_types(tuple): subset of rouge1, rouge2, ..., rougeL, rougeLsum
+        use_stemmer(bool): Porter stemming as rouge_score
+    '''
+    def __init__(self, rouge_types=ROUGE_TYPES, use_stemmer=True):
+        self.rouge_types = tuple(rouge_types)
+        self.vocab = Vocabulary(use_stemmer)
+
+    # 文字 -> 各行 (以換行分隔之句子) 之 token ids
+    def lines(self, text):
+        return [self.vocab.encode(line) for line in text.split('\n') if len(line)]
+
+    # 已編碼之 hyp / ref 各行 -> {rouge_type: (precision, recall, fmeasure)}
+    def score_lines(self, hyp_lines, ref_lines):
+        result = {}
+        ref, hyp = [t for line in ref_lines for t in line], [t for line in hyp_lines for t in line]
+        for rouge_type in self.rouge_types:
+            if rouge_type == 'rougeL':
+                result[rouge_type] = score_lcs(ref, hyp)
+            elif rouge_type == 'rougeLsum':
+                result[rouge_type] = score_lcs_summary(ref_lines, hyp_lines)
+            else:
+                result[rouge_type] = score_ngrams(ref, hyp, int(rouge_type[5:]))
+        return result
+
+    # 單組 (prediction, reference) -> {rouge_type: (precision, recall, fmeasure)}
+    def score(self, prediction, reference):
+        return self.score_lines(self.lines(prediction), self.lines(reference))
+
+    # 多組 fmeasure, 回傳 {rouge_type: np.array}
+    def score_batch(self, predictions, references):
+        scores = [self.score(p, r) for p, r in zip(predictions, references)]
+        return {key: np.array([s[key][2] for s in scores]) for key in self.rouge_types}
+
+    def compute(self, predictions, references, use_stemmer=None, use_aggregator=True, n_process=1, chunksize=256):
+        '''
+        Args:
+            predictions(list of str), references(list of str)
+            use_stemmer(bool): overrides the stemming of this instance
+            use_aggregator(bool): mean fmeasure (True) or fmeasure of every pair (False)
+            n_process(int): number of worker processes
+        '''
+        scorer = self if use_stemmer is None or use_stemmer == (self.vocab.stemmer is not None) \
+            else Rouge(self.rouge_types, use_stemmer)
+        predictions, references = list(predictions), list(references)
+        if n_process > 1 and len(predictions) > chunksize:
+            chunks = [(scorer.rouge_types, scorer.vocab.stemmer is not None,
+                       predictions[i:i+chunksize], references[i:i+chunksize])
+                      for i in range(0, len(predictions), chunksize)]
+            with multiprocessing.Pool(n_process) as pool:
+                parts = pool.map(_score_chunk, chunks)
+            scores = {key: np.concatenate([part[key] for part in parts]) for key in scorer.rouge_types}
+        else:
+            scores = scorer.score_batch(predictions, references)
+        if use_aggregator:
+            return {key: float(np.mean(value)) if len(value) else 0.0 for key, value in scores.items()}
+        return {key: value.tolist() for key, value in scores.items()}
+
+
+# worker - 各 process 自有詞表
+def _score_chunk(args):
+    rouge_types, use_stemmer, predictions, references = args
+    return Rouge(rouge_types, use_stemmer).score_batch(predictions, references)
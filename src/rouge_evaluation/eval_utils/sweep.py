@@ -0,0 +1,86 @@
+'''
+Threshold / trigram blocking sweep of the extractive stage (ext_score.ipynb main) in one pass:
+sentence probabilities are predicted once, sentences are tokenized once,
+every setting is then scored from the cached probabilities and token ids
+'''
+
+import numpy as np
+import pandas as pd
+from eval_utils.reader import sent_json
+from eval_utils.inference import predict_proba_batches, select_sentences
+from eval_utils.trigram_blocking import TrigramBlocker
+from eval_utils.rouge import Rouge
+
+
+SECTIONS = ['ALL', 'I', 'M', 'R', 'D']
+
+
+class Article:
+    '''
+    Cached sentences of one article
+    body sentences: section, rouge token ids per line, trigram set; abstract: token ids per section
+    '''
+    def __init__(self, sentJson, true_proba, rouge, block):
+        body = [(key, sent['text'].strip()) for key in 'IMRD' for sent in sentJson['body'][key]]
+        self.section = np.array([key for key, _ in body])
+        self.true_proba = true_proba
+        self.lines = [rouge.lines(text) for _, text in body]
+        self.trigrams = block.encode([text for _, text in body])
+        abstract = {key: [sent['text'].strip() for sent in sentJson['abstract'][key]] for key in 'IMRD'}
+        self.reference = {key: [line for text in abstract[key] for line in rouge.lines(text)] for key in 'IMRD'}
+        self.reference['ALL'] = [line for key in 'IMRD' for line in self.reference[key]]
+
+    # 對每章節之預測句依機率 (float16) 由高至低進行 trigram blocking
+    def blocking(self, pred, true_proba):
+        return TrigramBlocker.block_sections(self.trigrams, true_proba, self.section, pred)
+
+    # 選取句 -> 各章節 (hyp lines, ref lines)
+    def pairs(self, pred):
+        selected = np.flatnonzero(pred)
+        for key in SECTIONS:
+            ids = selected if key == 'ALL' else selected[self.section[selected] == key]
+            yield key, tuple(ids), [line for i in ids for line in self.lines[i]], self.reference[key]
+
+
+def sweep(pmcids, thresholds, model, block_cols, json_dir, parquet_dir,
+          blocking=(False, True), batch_size=1000, rouge_types=('rouge1', 'rouge2', 'rougeL', 'rougeLsum')):
+    '''
+    Args:
+        pmcids(list): articles of the split
+        thresholds(list of float): decision thresholds to evaluate
+        model: extractive classifier (load_ExtModel / load_ExtPredictor)
+        block_cols(list): feature columns dropped before prediction
+        json_dir, parquet_dir(str): sentence json / features folder (or corpus store)
+        blocking(tuple of bool): trigram blocking settings to evaluate
+    Returns:
+        results(dict): (threshold, blocking) -> ROUGE table (rouge type x ALL/I/M/R/D), as main() of ext_score.ipynb
+    '''
+    rouge, block = Rouge(rouge_types), TrigramBlocker()
+    articles = []
+    for batch, lengths, true_proba in predict_proba_batches(model, pmcids, block_cols, parquet_dir, batch_size):
+        offset = 0
+        for pmcid, n in zip(batch, lengths):
+            articles.append(Article(sent_json(f'{json_dir}/{pmcid}.json'), true_proba[offset:offset+n], rouge, block))
+            offset += n
+    lengths = [len(article.true_proba) for article in articles]
+    all_proba = np.concatenate([article.true_proba for article in articles]) if articles else np.zeros(0)
+
+    results, cache = {}, {}
+    for threshold in thresholds:
+        pred, true_proba = select_sentences(all_proba.copy(), lengths, threshold)
+        for use_blocking in blocking:
+            scores = {key: {t: [] for t in rouge.rouge_types} for key in SECTIONS}
+            offset = 0
+            for index, (article, n) in enumerate(zip(articles, lengths)):
+                p, tp = pred[offset:offset+n], true_proba[offset:offset+n]
+                offset += n
+                p = article.blocking(p, tp) if use_blocking else p.astype(bool)
+                for key, ids, hyp, ref in article.pairs(p):
+                    # 相同選句之分數只計算一次
+                    if (index, key, ids) not in cache:
+                        cache[(index, key, ids)] = rouge.score_lines(hyp, ref)
+                    for t, value in cache[(index, key, ids)].items():
+                        scores[key][t].append(value[2])
+            res = {key: {t: np.mean(v) if v else 0.0 for t, v in scores[key].items()} for key in SECTIONS}
+            results[(threshold, use_blocking)] = pd.DataFrame(res).round(4)
+    return results
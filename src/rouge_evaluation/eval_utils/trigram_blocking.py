@@ -1,4 +1,7 @@
+import re
+import sys
 import nltk
+import numpy as np
 
 class TrigramBlock:
     def __init__(self):
@@ -19,4 +22,103 @@ class TrigramBlock:
 
     def _get_trigrams(self, tokens):
         trigrams = [' '.join(tokens[i:i+3]) for i in range(len(tokens)-2)]
-        return trigrams
\ No newline at end of file
+        return trigrams
+
+
+# 非字母且非空白之字元 (與 str.isalpha / str.isspace 相同判斷), 首次使用時建立
+_NON_ALPHA_RE = None
+def _non_alpha_re():
+    global _NON_ALPHA_RE
+    if _NON_ALPHA_RE is None:
+        ranges, start = [], None
+        for code in range(sys.maxunicode + 2):
+            keep = code <= sys.maxunicode and (chr(code).isalpha() or chr(code).isspace())
+            if not keep and start is None:
+                start = code
+            elif keep and start is not None:
+                ranges.append('%s-%s' % (re.escape(chr(start)), re.escape(chr(code - 1))))
+                start = None
+        _NON_ALPHA_RE = re.compile('[%s]+' % ''.join(ranges))
+    return _NON_ALPHA_RE
+
+# ASCII 文字直接以 translate 刪除
+_ASCII_DELETE = {code: None for code in range(128) if not (chr(code).isalpha() or chr(code).isspace())}
+
+def letters_only(text):
+    text = text.lower()
+    return text.translate(_ASCII_DELETE) if text.isascii() else _non_alpha_re().sub('', text)
+
+# 由高至低排序之索引 (與 pd.Series.sort_values(ascending=False) 相同之同值順序)
+def descending(values):
+    return np.arange(len(values))[::-1][values[::-1].argsort(kind='quicksort')][::-1]
+
+
+class TrigramBlocker:
+    '''
+    Article-level trigram blocking with the same decisions as TrigramBlock:
+    all candidates are tokenized in one pass (lowercase, letters only, nltk word_tokenize contractions)
+    and trigrams are 64-bit integers (3 x 21-bit token ids of the article vocabulary)
+    '''
+    SEP = '\x00'
+
+    def __init__(self):
+        from nltk.tokenize.destructive import NLTKWordTokenizer
+        # 只含字母及空白之文字, word_tokenize 僅會拆開無撇號之縮寫 (cannot -> can not 等), 合併為一個 regex
+        patterns = NLTKWordTokenizer.CONTRACTIONS2 + NLTKWordTokenizer.CONTRACTIONS3
+        self.contractions = re.compile('|'.join('(?:%s)' % p.pattern.replace('(?i)', '') for p in patterns), re.I)
+
+    @staticmethod
+    def _split(match):
+        return ' %s ' % ' '.join(group for group in match.groups() if group is not None)
+
+    def tokenize(self, texts):
+        if not len(texts):
+            return []
+        text = (' %s ' % self.SEP).join(letters_only(str(t)) for t in texts) + ' '
+        text = self.contractions.sub(self._split, text)
+        return [part.split() for part in text.split(self.SEP)]
+
+    # 每句之 trigram 集合 (整數)
+    def encode(self, texts):
+        vocab, result = {}, []
+        for tokens in self.tokenize(texts):
+            if len(tokens) < 3:
+                result.append(set())
+                continue
+            ids = np.array([vocab.setdefault(token, len(vocab)) for token in tokens], dtype=np.uint64)
+            codes = (ids[:-2] << np.uint64(42)) | (ids[1:-1] << np.uint64(21)) | ids[2:]
+            result.append(set(codes.tolist()))
+        return result
+
+    # 各章節之預測句依機率 (float16) 由高至低檢查, 與先前句子有相同 trigram 者不保留
+    @staticmethod
+    def block_sections(trigrams, proba, sections, predict):
+        '''
+        Args:
+            trigrams(list or dict): trigram set of each (predicted) sentence
+            proba, sections, predict: sentences of one article
+        Returns:
+            predict(np.array of bool): predictions after trigram blocking
+        '''
+        predict = np.asarray(predict, dtype=bool).copy()
+        sections, proba = np.asarray(sections), np.asarray(proba, dtype='float16')
+        for key in set(sections[predict]):
+            idx = np.flatnonzero(predict & (sections == key))
+            seen = set()
+            for i in idx[descending(proba[idx])]:
+                if not seen.isdisjoint(trigrams[i]):
+                    predict[i] = False
+                seen |= trigrams[i]
+        return predict
+
+    # 文章之預測句 trigram blocking (只編碼預測句), 回傳新的 predict mask
+    def block_article(self, texts, proba, sections, predict):
+        '''
+        Args:
+            texts, proba, sections, predict: body sentences of one article (as the columns of convert_sentence_df)
+        Returns:
+            predict(np.array of bool): predictions after trigram blocking
+        '''
+        texts, candidates = list(texts), np.flatnonzero(np.asarray(predict, dtype=bool))
+        trigrams = dict(zip(candidates, self.encode([texts[i] for i in candidates])))
+        return self.block_sections(trigrams, proba, sections, predict)